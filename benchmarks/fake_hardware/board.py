@@ -0,0 +1,7 @@
+"""
+Stand-in for Adafruit's board module so the lamp can drive a fake strip (see neopixel.py) on any machine.
+"""
+D10 = "D10"
+D12 = "D12"
+D18 = "D18"
+D21 = "D21"
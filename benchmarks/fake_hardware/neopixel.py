@@ -0,0 +1,52 @@
+"""
+Stand-in for Adafruit's neopixel module. Keeps the pixels in memory and makes show() take as long as sending
+them down the wire would (30us per LED at 800kHz plus the 50us latch), so write costs are realistic.
+"""
+from time import sleep
+
+RGB = "RGB"
+GRB = "GRB"
+
+LED_SECONDS = 30e-6
+LATCH_SECONDS = 50e-6
+
+
+class NeoPixel:
+    def __init__(self, pin, n, brightness=1.0, auto_write=True, pixel_order=GRB):
+        self.pin = pin
+        self.n = n
+        self.brightness = brightness
+        self.auto_write = auto_write
+        self.byteorder = pixel_order
+        self.shows = 0
+
+        self._pixels = [(0, 0, 0)] * n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, index):
+        return self._pixels[index]
+
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = [tuple(v) for v in value]
+            if len(value) != len(range(*index.indices(self.n))):
+                raise ValueError("Slice and value lengths don't match")
+        else:
+            value = tuple(value)
+        self._pixels[index] = value
+        if self.auto_write:
+            self.show()
+
+    def fill(self, color):
+        self._pixels = [tuple(color)] * self.n
+        if self.auto_write:
+            self.show()
+
+    def show(self):
+        sleep(LATCH_SECONDS + LED_SECONDS * self.n)
+        self.shows += 1
+
+    def deinit(self):
+        pass
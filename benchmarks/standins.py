@@ -0,0 +1,172 @@
+"""
+Stand-ins for everything the lamp talks to, so the benchmarks run on any Linux box: a fake board/neopixel
+(fake_hardware/) and a local HTTP server replaying recorded weatherapi.com and statsapi.mlb.com payloads (fixtures/).
+"""
+import os
+import sys
+import json
+import copy
+import hashlib
+from time import sleep
+from threading import Thread
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from datetime import date, datetime, time, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+FAKE_HARDWARE_DIR = os.path.join(BENCHMARKS_DIR, "fake_hardware")
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return json.load(f)
+
+
+def weather_payload(weather, today=None):
+    """
+    :return: The recorded forecast moved to start at midnight today (local time)
+    """
+    weather = copy.deepcopy(weather)
+    midnight = datetime.combine(today or date.today(), time())
+    for d, day in enumerate(weather["forecast"]["forecastday"]):
+        day_dt = midnight + timedelta(days=d)
+        day["date"] = day_dt.strftime("%Y-%m-%d")
+        day["date_epoch"] = int(day_dt.timestamp())
+        for h, hour in enumerate(day["hour"]):
+            hour_dt = day_dt + timedelta(hours=h)
+            hour["time"] = hour_dt.strftime("%Y-%m-%d %H:%M")
+            hour["time_epoch"] = int(hour_dt.timestamp())
+
+    now = datetime.now().replace(second=0, microsecond=0)
+    weather["current"]["last_updated"] = now.strftime("%Y-%m-%d %H:%M")
+    weather["current"]["last_updated_epoch"] = int(now.timestamp())
+    return weather
+
+
+def schedule_payload(schedule, start_date=None):
+    """
+    :return: The recorded schedule moved to start on start_date
+    """
+    schedule = copy.deepcopy(schedule)
+    shift = (start_date or date.today()) - date.fromisoformat(schedule["dates"][0]["date"])
+    for day in schedule["dates"]:
+        day["date"] = (date.fromisoformat(day["date"]) + shift).isoformat()
+        for game in day["games"]:
+            game["officialDate"] = day["date"]
+            game_dt = datetime.strptime(game["gameDate"], "%Y-%m-%dT%H:%M:%SZ") + shift
+            game["gameDate"] = game_dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return schedule
+
+
+class StandInServer:
+    """
+    Local HTTP server answering like weatherapi.com and statsapi.mlb.com with the recorded payloads.
+    Sends ETags so the lamp's conditional requests get 304s like they would from the real APIs.
+    """
+    weather_path = "/v1/forecast.json"
+    schedule_path = "/api/v1/schedule/games/"
+
+    def __init__(self, latency=0):
+        """
+        :param latency: Seconds added to every response, to stand in for the network
+        """
+        self.latency = latency
+        self.requests = Counter()
+
+        self._weather = load_fixture("weatherapi_forecast.json")
+        self._schedule = load_fixture("mlb_schedule.json")
+        self._server = None
+
+    def _respond(self, path, query):
+        if path == self.weather_path:
+            return weather_payload(self._weather)
+        if path == self.schedule_path:
+            start_date = query.get("startDate", [None])[0]
+            return schedule_payload(self._schedule, start_date and date.fromisoformat(start_date))
+        return None
+
+    def start(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                standin.requests[url.path] += 1
+                if standin.latency:
+                    sleep(standin.latency)
+
+                payload = standin._respond(url.path, parse_qs(url.query))
+                if payload is None:
+                    self.send_error(404)
+                    return
+                body = json.dumps(payload).encode()
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def env(self):
+        return {
+            "WEATHER_API_URL": self.base_url + self.weather_path,
+            "SCHEDULE_URL": self.base_url + self.schedule_path,
+        }
+
+
+def lamp_env(server, **overrides):
+    """
+    :return: Environment for running the lamp against the stand-ins (in this process or a child)
+    """
+    python_path = [FAKE_HARDWARE_DIR, REPO_DIR]
+    if os.getenv("PYTHONPATH"):
+        python_path.append(os.getenv("PYTHONPATH"))
+    env = {
+        "PYTHONPATH": os.pathsep.join(python_path),
+        "WEATHER_API_KEY": "benchmark",
+        "LAT": os.getenv("LAT") or "41.95",
+        "LON": os.getenv("LON") or "-87.66",
+        "PRINT_ONLY": "True",
+        "REVERSE_LEDS": "False",
+        "NUM_LEDS": "6",
+    }
+    env.update(server.env())
+    env.update({k: str(v) for k, v in overrides.items()})
+    return env
+
+
+def install(env):
+    """
+    Applies env to this process. Must run before anything from src is imported, as they read it on import.
+    """
+    os.environ.update(env)
+    for path in reversed(env["PYTHONPATH"].split(os.pathsep)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Measures how long the lamp daemon takes from exec to its first frame.
+
+    python -m benchmarks.startup -s ukraine_flag -n 10
+
+The daemon uses the current environment/.env, so set PRINT_ONLY=True to run it without hardware.
+"""
+import os
+import sys
+import click
+import tempfile
+import subprocess
+from statistics import median
+from time import perf_counter, sleep
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def launch(run_dir, screen, args=(), env=None):
+    """
+    Starts the lamp daemon in run_dir with its control socket there too
+    :return: The process and the path of its control socket
+    """
+    socket_path = os.path.join(run_dir, "moonlamp.sock")
+    python_path = os.pathsep.join(p for p in [REPO_DIR, os.getenv("PYTHONPATH")] if p)
+    env = dict(os.environ, **(env or {}), CONTROL_SOCKET=socket_path, PYTHONPATH=python_path)
+    cmd = [sys.executable, "-m", "src.set_lamp", "--mode", "on", *args]
+    for s in screen:
+        cmd += ["-s", s]
+    process = subprocess.Popen(cmd, cwd=run_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    return process, socket_path
+
+
+def wait_for_frame(process, socket_path, timeout=60):
+    """
+    :return: Once the daemon has shown its first frame
+    """
+    from src.control import send_command
+
+    start = perf_counter()
+    while perf_counter() - start < timeout:
+        if process.poll() is not None:
+            raise RuntimeError(f"The lamp exited early: {process.stderr.read().decode()}")
+        try:
+            if send_command("status", path=socket_path, timeout=1)["last_frame"] is not None:
+                return
+        except OSError:
+            pass
+        sleep(0.002)
+    raise TimeoutError(f"No frame after {timeout}s")
+
+
+def time_to_first_frame(screen, timeout=60):
+    with tempfile.TemporaryDirectory() as run_dir:
+        start = perf_counter()
+        process, socket_path = launch(run_dir, screen)
+        try:
+            wait_for_frame(process, socket_path, timeout)
+            return perf_counter() - start
+        finally:
+            process.terminate()
+            process.wait()
+
+
+def run(screen=("ukraine_flag",), runs=5):
+    times = [time_to_first_frame(screen) for _ in range(runs)]
+    return {
+        "runs": runs,
+        "screens": list(screen),
+        "min_s": min(times),
+        "median_s": median(times),
+        "max_s": max(times),
+    }
+
+
+@click.command()
+@click.option('-s', '--screen', multiple=True, default=["ukraine_flag"], help='Screen(s) to start with')
+@click.option('-n', '--runs', default=5, help='Number of cold starts to time')
+def main(screen, runs):
+    result = run(screen, runs)
+    print(f"Time to first frame over {runs} runs: min {result['min_s']:.3f}s, "
+          f"median {result['median_s']:.3f}s, max {result['max_s']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the render, refresh and web hot paths on any Linux box, with a fake LED strip and local stand-ins
+for the weather and MLB APIs (see standins.py). Results are written as JSON so runs can be compared.
+
+    python -m benchmarks.suite -o results.json
+    python -m benchmarks.suite -o new.json --baseline results.json
+"""
+import os
+import sys
+import json
+import click
+import platform
+import tempfile
+import contextlib
+import subprocess
+from threading import Thread, Event
+from datetime import datetime
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks import startup
+from benchmarks.standins import StandInServer, lamp_env, install, REPO_DIR
+
+BENCHMARKS = ["set_leds", "screens", "cycle", "cold_start", "flask", "gallery"]
+# Fields that tell apart the entries of a benchmark that returns a list
+LABELS = ["num_leds", "path", "endpoint", "clients", "screens", "workers"]
+
+
+def summarize(times):
+    """
+    :param times: Durations in seconds
+    """
+    times = sorted(times)
+
+    def percentile(p):
+        return times[min(len(times) - 1, int(p / 100 * len(times)))]
+
+    return {
+        "n": len(times),
+        "mean_s": sum(times) / len(times),
+        "min_s": times[0],
+        "p50_s": percentile(50),
+        "p95_s": percentile(95),
+        "p99_s": percentile(99),
+        "max_s": times[-1],
+    }
+
+
+def timed(func, *args, **kwargs):
+    start = perf_counter()
+    func(*args, **kwargs)
+    return perf_counter() - start
+
+
+def log(msg):
+    print(msg, file=sys.stderr)
+
+
+def bench_set_leds(num_leds=(6, 60, 300), seconds=2.0):
+    """
+    Lamp.set_leds calls per second with a different frame every call, printed (PRINT_ONLY) or sent to the strip
+    """
+    from src import lamp, frames, hardware
+
+    results = []
+    for n in num_leds:
+        sweep = [frames.bar(n, v, (255, 255, 0), maximum=100) for v in range(101)]
+        for path in ["print_only", "hardware"]:
+            if path == "hardware":
+                # Every lamp shares one strip, so start a new one with this many LEDs
+                hardware._framebuffer = hardware._compositor = None
+            bench_lamp = lamp.Lamp(print_only=(path == "print_only"), reverse_leds=False, num_leds=n)
+            bench_lamp._screen_id = "benchmark"
+
+            times = []
+            start = perf_counter()
+            while perf_counter() - start < seconds:
+                times.append(timed(bench_lamp.set_leds, sweep[len(times) % len(sweep)]))
+            elapsed = perf_counter() - start
+
+            result = {"num_leds": n, "path": path, "calls_per_s": len(times) / elapsed, **summarize(times)}
+            if path == "hardware":
+                result["strip_writes_per_s"] = bench_lamp.pixels.shows / elapsed
+            results.append(result)
+    return results
+
+
+def bench_screens(runs=50):
+    """
+    Latency of every screen in possible_screens. The first call includes fetching from the stand-in APIs.
+    """
+    import src.possible_screens as ps
+    from src.screens import Screen
+    from src.history import history
+
+    results = {}
+    for name, screen in vars(ps).items():
+        if not isinstance(screen, Screen):
+            continue
+        first = timed(screen.show_screen)
+        times = [timed(screen.show_screen) for _ in range(runs)]
+        results[name] = {"first_s": first, **summarize(times)}
+
+        last_frame = history.last_frame()
+        if last_frame is not None and str(last_frame.extra_info).startswith("Error on"):
+            results[name]["error"] = last_frame.extra_info
+    return results
+
+
+def bench_cycle(delay=0.2, cycles=10):
+    """
+    How closely Screens keeps to its delay between screens, and how much that adds up over the cycles
+    """
+    import src.possible_screens as ps
+    from src.screens import Screens
+    from src.history import history
+
+    screens = Screens([ps.ukraine_flag, ps.current_moon_screen, ps.sunniness_screen, ps.feels_like_screen],
+                      delay=delay)
+    expected = cycles * len(screens.screens) + 1
+    shown = []
+    done = Event()
+
+    def listener(frame):
+        shown.append(perf_counter())
+        if len(shown) >= expected:
+            done.set()
+
+    history.add_listener(listener)
+    Thread(target=screens.show_screens, kwargs={"mode": "on"}, daemon=True).start()
+    done.wait(timeout=expected * delay + 30)
+    history.remove_listener(listener)
+    screens.reconfigure(mode="off")
+
+    intervals = [b - a for a, b in zip(shown, shown[1:])]
+    errors = [abs(i - delay) for i in intervals]
+    return {
+        "delay_s": delay,
+        "screens": len(screens.screens),
+        "cycles": cycles,
+        "interval": summarize(intervals),
+        "abs_error": summarize(errors),
+        # How far the last screen was from when it was due, after every slot's error
+        "drift_s": (shown[-1] - shown[0]) - delay * len(intervals),
+    }
+
+
+def bench_cold_start(runs=5):
+    return [startup.run(screen, runs) for screen in [("ukraine_flag",), ("sunniness_screen",)]]
+
+
+def bench_flask(clients=(1, 8, 32), requests_per_client=50, endpoints=("/", "/status/", "/snapshot/", "/watch/")):
+    """
+    Endpoint latency with the lamp daemon running and several clients hitting the app at once
+    """
+    import logging
+    import requests
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    with tempfile.TemporaryDirectory() as run_dir:
+        process, socket_path = startup.launch(run_dir, ["ukraine_flag", "current_moon_screen"],
+                                              args=["--delay", "1"], env={"HISTORY_FLUSH_SECONDS": "1"})
+        work_dir = os.getcwd()
+        try:
+            startup.wait_for_frame(process, socket_path)
+            # flask_app reads the socket path on import and lamp_html.txt from its working directory
+            os.environ["CONTROL_SOCKET"] = socket_path
+            os.chdir(run_dir)
+            import flask_app
+
+            server = make_server("127.0.0.1", 0, flask_app.app, threaded=True)
+            Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f"http://127.0.0.1:{server.server_port}"
+
+            def client(endpoint):
+                times = []
+                failures = 0
+                with requests.Session() as session:
+                    for _ in range(requests_per_client):
+                        start = perf_counter()
+                        res = session.get(base_url + endpoint, headers={"Accept-Encoding": "gzip"})
+                        times.append(perf_counter() - start)
+                        failures += res.status_code != 200
+                return times, failures
+
+            results = []
+            for endpoint in endpoints:
+                for concurrency in clients:
+                    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                        start = perf_counter()
+                        done = list(executor.map(client, concurrency * [endpoint]))
+                        elapsed = perf_counter() - start
+                    times = [t for client_times, _ in done for t in client_times]
+                    results.append({
+                        "endpoint": endpoint,
+                        "clients": concurrency,
+                        "requests_per_s": len(times) / elapsed,
+                        "failures": sum(failures for _, failures in done),
+                        **summarize(times),
+                    })
+            server.shutdown()
+            return results
+        finally:
+            os.chdir(work_dir)
+            process.terminate()
+            process.wait()
+
+
+def bench_gallery(num_leds=(6, 60, 300), workers=(1, os.cpu_count())):
+    """
+    Frames per second rendered by src.gallery, with and without writing a PNG of each
+    """
+    from src import gallery
+
+    results = []
+    for count in sorted(set(workers)):
+        for path in ["frames", "png"]:
+            with tempfile.TemporaryDirectory() as png_dir:
+                start = perf_counter()
+                rendered = gallery.render_all(num_leds, workers=count, png_dir=png_dir if path == "png" else None)
+                elapsed = perf_counter() - start
+            results.append({"path": path, "workers": count, "frames": len(rendered),
+                            "frames_per_s": len(rendered) / elapsed, "elapsed_s": elapsed})
+    return results
+
+
+def metadata(server):
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                            capture_output=True, text=True).stdout.strip()
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "api_latency_s": server.latency,
+    }
+
+
+def flatten(results, prefix=""):
+    """
+    :return: Every number in results keyed by its path, e.g. "flask./status/:8.p95_s"
+    """
+    if isinstance(results, dict):
+        items = results.items()
+    elif isinstance(results, list) and all(isinstance(r, dict) for r in results):
+        # Name list entries by what they measured rather than by their position
+        items = [(":".join(str(r[k]) for k in LABELS if k in r), r) for r in results]
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        return {prefix: results}
+    else:
+        return {}
+    flat = {}
+    for k, v in items:
+        flat.update(flatten(v, f"{prefix}.{k}" if prefix else str(k)))
+    return flat
+
+
+def compare(baseline, results):
+    old = flatten({k: v for k, v in baseline.items() if k != "meta"})
+    new = flatten({k: v for k, v in results.items() if k != "meta"})
+    for key in sorted(old.keys() & new.keys()):
+        if not (key.endswith("_s") or key.endswith("per_s")) or not old[key]:
+            continue
+        change = 100 * (new[key] - old[key]) / old[key]
+        print(f"{key:<60} {old[key]:>12.6g} {new[key]:>12.6g} {change:>+8.1f}%")
+
+
+@click.command()
+@click.option('-o', '--output', default="benchmark_results.json", help='Where to write the results (JSON)')
+@click.option('-b', '--benchmark', multiple=True, type=click.Choice(BENCHMARKS),
+              help='Benchmark(s) to run (default=all)')
+@click.option('--quick', is_flag=True, help='Run fewer iterations, as a smoke test')
+@click.option('--api-latency', default=0.0, help='Seconds the stand-in APIs wait before answering')
+@click.option('--baseline', type=click.Path(exists=True), help='Earlier results to compare against')
+def main(output, benchmark, quick, api_latency, baseline):
+    benchmark = benchmark or BENCHMARKS
+    output = os.path.abspath(output)
+    server = StandInServer(latency=api_latency).start()
+    work_dir = tempfile.mkdtemp(prefix="moonlamp-bench-")
+    install(lamp_env(server, CONTROL_SOCKET=os.path.join(work_dir, "moonlamp.sock")))
+    # The lamp history files end up here instead of in the repo
+    os.chdir(work_dir)
+
+    results = {"meta": metadata(server)}
+    runs = {
+        "set_leds": lambda: bench_set_leds(seconds=0.2 if quick else 2.0),
+        "screens": lambda: bench_screens(runs=5 if quick else 50),
+        "cycle": lambda: bench_cycle(delay=0.1 if quick else 0.2, cycles=2 if quick else 10),
+        "cold_start": lambda: bench_cold_start(runs=1 if quick else 5),
+        "flask": lambda: bench_flask(clients=(1, 4) if quick else (1, 8, 32),
+                                     requests_per_client=5 if quick else 50),
+        "gallery": lambda: bench_gallery(num_leds=(6,) if quick else (6, 60, 300)),
+    }
+    for name in BENCHMARKS:
+        if name not in benchmark:
+            continue
+        log(f"Running {name}...")
+        # The lamp prints every frame, keep that out of the way
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            results[name] = runs[name]()
+    results["meta"]["api_requests"] = dict(server.requests)
+    server.stop()
+
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    log(f"Results written to {output}")
+
+    if baseline:
+        with open(baseline) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,23 @@
 import os
-import re
+import gzip
+import zlib
 from time import sleep
+from queue import Empty
 from flask_wtf import FlaskForm
-from subprocess import Popen, check_output, CalledProcessError
+from subprocess import Popen
+from src.broadcast import Broadcaster
+from src.control import send_command, stream_command
+from src.frame_ring import FrameRing
+from src.frames import to_colors
 from flask import Flask, render_template_string, request, json
 from wtforms import SubmitField, SelectField, IntegerField
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.urandom(24)
 
+# One connection to the lamp shared by every /stream/ client
+frames_broadcaster = Broadcaster(lambda: stream_command("subscribe"))
+
 
 class SwitchForm(FlaskForm):
     # TODO: add screen selection (multi select)
@@ -40,6 +49,35 @@ home_template = '''
 </form>
 '''
 
+live_template = '''
+<head>
+<link rel="shortcut icon" href="{{ url_for('static', filename='favicon.ico') }}">
+</head>
+<font style="font-family:monospace;"><span id="time"></span> <span id="lamp"></span> <span id="info"></span></font>
+<script>
+function toHex(color) {
+    return "#" + color.map(c => c.toString(16).padStart(2, "0")).join("");
+}
+function show(frame) {
+    if (!frame) return;
+    document.getElementById("time").textContent = frame.timestamp;
+    document.getElementById("info").textContent = frame.extra_info || "";
+    document.getElementById("lamp").innerHTML = frame.colors.map(function (color) {
+        var hex = toHex(color);
+        var style = hex === "#000000" ? "fill:#FFFFFF;stroke-width:1;stroke:#FFFFFF"
+                                      : "fill:" + hex + ";stroke-width:1;stroke:#000000";
+        return '<svg width="20" height="20"><rect width="20" height="20" style="' + style + '"/></svg>';
+    }).join("");
+}
+fetch("{{ url_for('snapshot') }}").then(r => r.json()).then(s => show(s.status.last_frame));
+new EventSource("{{ url_for('stream') }}").onmessage = e => show(JSON.parse(e.data));
+</script>
+'''
+
+
+def accepts_gzip():
+    return "gzip" in request.headers.get("Accept-Encoding", "")
+
 
 def get_cmd(screens=[], mode=None, delay=None, timer_length=None):
     cmd = ["./set_lamp.sh"]
@@ -55,6 +93,15 @@ def get_cmd(screens=[], mode=None, delay=None, timer_length=None):
     return cmd
 
 
+def get_current_values():
+    try:
+        status = send_command("status", timeout=1)
+    except OSError:
+        # The lamp isn't running
+        return {}
+    return {"mode": status["mode"], "delay": status["delay"], "timer-length": status["timer_length"]}
+
+
 @app.route('/', methods=["GET", "POST"])
 def moon_lamp_switch():
     if request.method == "POST":
@@ -68,62 +115,48 @@ def moon_lamp_switch():
         delay = form.get("delay", res.get("delay", None))
         timer_length = form.get("timer_length", res.get("timer_length", None))
 
-        cmd = get_cmd(mode=mode, delay=delay, timer_length=timer_length)
-        print(f"Running {' '.join(cmd)}")
-        process = Popen(cmd)
-        sleep(2)
-        res = process.poll()
-        if res is not None and res != 0:
-            return "Unknown error, try again"
-        return "Success!"
+        try:
+            applied = send_command("set", mode=mode or None, delay=delay or None, timer_length=timer_length or None)
+        except RuntimeError as e:
+            return f"Error: {e}"
+        except OSError:
+            # The lamp isn't running, so start it
+            cmd = get_cmd(mode=mode, delay=delay, timer_length=timer_length)
+            print(f"Running {' '.join(cmd)}")
+            process = Popen(cmd)
+            sleep(2)
+            res = process.poll()
+            if res is not None and res != 0:
+                return "Unknown error, try again"
+            return "Success!"
+        return "Success!" if applied else "Change queued, it will be applied shortly"
 
     form = SwitchForm()
-
-    # Get current status
-    # TODO: rename this file
-    if os.path.exists("moonlamp.pid"):
-        with open("moonlamp.pid", "r") as f:
-            current_pid = int(f.read())
-        try:
-            current_status = check_output(["ps", "-f", "-p",  str(current_pid)]).decode()
-        except CalledProcessError:
-            current_status = ""
-    else:
-        current_status = ""
-
-    current_values = {}
-    for key in ["mode", "delay", "timer-length"]:
-        value = re.search(rf"--{key} ([^\s]+)", current_status)
-        if value:
-            current_values[key] = value.group(1)
+    current_values = get_current_values()
 
     return render_template_string(home_template, form=form, current_values=current_values)
 
 
+_watch_cache = {"mtime": None, "html": ""}
+
+
 @app.route('/watch/')
 def watch():
-    with open("lamp_html.txt") as f:
-        lamp = f.read()
-    return lamp
+    # The daemon only rewrites lamp_html.txt in batches, so only re-read it when it changed
+    try:
+        mtime = os.stat("lamp_html.txt").st_mtime_ns
+    except FileNotFoundError:
+        return ""
+    if mtime != _watch_cache["mtime"]:
+        with open("lamp_html.txt") as f:
+            _watch_cache["html"] = f.read()
+        _watch_cache["mtime"] = mtime
+    return _watch_cache["html"]
 
 
 @app.route('/status/')
 def status():
-    if os.path.exists("moonlamp.pid"):
-        with open("moonlamp.pid", "r") as f:
-            current_pid = int(f.read())
-        try:
-            current_status = check_output(["ps", "-f", "-p", str(current_pid)]).decode()
-        except CalledProcessError:
-            current_status = ""
-    else:
-        current_status = ""
-
-    current_values = {}
-    for key in ["mode", "delay", "timer-length"]:
-        value = re.search(rf"--{key} ([^\s]+)", current_status)
-        if value:
-            current_values[key] = value.group(1)
+    current_values = get_current_values()
     current_values["mode"] = current_values.get("mode", "off")
     response = app.response_class(
         response=json.dumps(current_values),
@@ -134,5 +167,89 @@ def status():
     return response
 
 
+@app.route('/live/')
+def live():
+    return render_template_string(live_template)
+
+
+@app.route('/snapshot/')
+def snapshot():
+    try:
+        current = {"status": send_command("status", timeout=1), "frames": send_command("frames", timeout=1)}
+    except OSError:
+        current = {"status": {"mode": "off", "last_frame": None}, "frames": []}
+
+    body = json.dumps(current).encode()
+    response = app.response_class(response=body, status=200, mimetype='application/json')
+    response.headers["Vary"] = "Accept-Encoding"
+    if accepts_gzip():
+        response.set_data(gzip.compress(body))
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+_frame_ring = {"ring": None}
+
+
+@app.route('/leds/')
+def leds():
+    # What the strip is showing right now (including fades and blinks), read from the frame ring (LED_DRIVER=shm)
+    ring = _frame_ring["ring"]
+    if ring is None or ring.replaced():
+        # The old ring is left to be garbage collected, another request may still be reading it
+        try:
+            ring = _frame_ring["ring"] = FrameRing.open()
+        except (FileNotFoundError, ValueError):
+            _frame_ring["ring"] = None
+            return app.response_class(response=json.dumps(None), status=404, mimetype='application/json')
+
+    latest = ring.latest()
+    current = None
+    if latest is not None:
+        number, written_at, frame = latest
+        current = {"frame": number, "time": written_at, "colors": to_colors(frame)}
+    return app.response_class(response=json.dumps(current), status=200, mimetype='application/json')
+
+
+@app.route('/metrics')
+def metrics():
+    try:
+        body = send_command("metrics", timeout=2)
+        up = 1
+    except OSError:
+        # The lamp isn't running, which is worth recording too
+        body = ""
+        up = 0
+    body = f"# HELP moonlamp_up Whether the lamp daemon is running\n# TYPE moonlamp_up gauge\nmoonlamp_up {up}\n" + body
+    return app.response_class(response=body, status=200, mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/stream/')
+def stream():
+    subscriber = frames_broadcaster.subscribe()
+    use_gzip = accepts_gzip()
+
+    def events():
+        # Each event is flushed on its own so it isn't held back by the compressor
+        compressor = zlib.compressobj(wbits=31) if use_gzip else None
+        try:
+            while True:
+                try:
+                    event = f"data: {json.dumps(subscriber.get(timeout=15))}\n\n"
+                except Empty:
+                    event = ": keepalive\n\n"
+                event = event.encode()
+                if compressor is not None:
+                    event = compressor.compress(event) + compressor.flush(zlib.Z_SYNC_FLUSH)
+                yield event
+        finally:
+            frames_broadcaster.unsubscribe(subscriber)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "Vary": "Accept-Encoding"}
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return app.response_class(events(), mimetype="text/event-stream", headers=headers)
+
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=8080, debug=True)
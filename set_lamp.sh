@@ -1,5 +1,13 @@
 #!/bin/bash
 
+# Change the running lamp in place if there is one, only restart it if it isn't running
+python3 -m src.control "$@"
+STATUS=$?
+if [ $STATUS -ne 1 ]
+then
+    exit $STATUS
+fi
+
 # Kill lamp procces, moonlamp, and its child
 CPID=$(pgrep -P $(cat moonlamp.pid))
 sudo kill -s TERM $(cat setlamp.pid)
@@ -20,15 +28,28 @@ then
     exit 2
 fi
 
+# With LED_DRIVER=shm only the pixel driver needs root, the lamp itself runs as the current user
+if [ "$LED_DRIVER" = "shm" ] || grep -qs "^LED_DRIVER=shm" .env
+then
+    LAMP_SUDO=""
+    DRIVER_PID=$(cat driver.pid 2> /dev/null)
+    if [ -z "$DRIVER_PID" ] || [ ! -e /proc/$DRIVER_PID ]
+    then
+        sudo python3 -m src.driver &>> driver.log & echo $! > driver.pid
+    fi
+else
+    LAMP_SUDO="sudo"
+fi
+
 # Start the new prcoess
 echo $$ > setlamp.pid
-sudo  python3 -m src.set_lamp "$@" &>> flask.log  & echo $! > moonlamp.pid
+$LAMP_SUDO python3 -m src.set_lamp "$@" &>> flask.log  & echo $! > moonlamp.pid
 
 # If above fails, set lamp to a failed pattern
 if  wait $(<"moonlamp.pid")
 then
     true
 else
-    sudo python3 -m src.set_lamp -s error_screen --delay=600 &>> flask.log & echo $! > moonlamp.pid
+    $LAMP_SUDO python3 -m src.set_lamp -s error_screen --delay=600 &>> flask.log & echo $! > moonlamp.pid
     exit 1
 fi
@@ -0,0 +1,164 @@
+import os
+from time import monotonic, sleep
+from threading import Thread, Event, Lock
+from src import metrics
+
+FPS = int(os.getenv("ANIMATION_FPS", 30))
+FADE_SECONDS = float(os.getenv("FADE_SECONDS", 0))
+
+
+def interpolate(start, end, steps):
+    """
+    Interpolates two frames over the whole strip at once
+    :param start: Frame (flat bytes) to start from
+    :param end: Frame (flat bytes) to end on
+    :param steps: Number of frames to generate, the last one is end
+    :return: List of frames
+    """
+    deltas = [b - a for a, b in zip(start, end)]
+    return [bytes(a + d * k // steps for a, d in zip(start, deltas)) for k in range(1, steps + 1)]
+
+
+class Effect:
+    """
+    A list of keyframes (duration in seconds, frame, fade) played one after the other.
+    If fade is True the effect fades from the previous keyframe to frame over the duration,
+    otherwise frame is held for the duration.
+    """
+    def __init__(self, keyframes=None):
+        self.keyframes = keyframes or []
+
+    def then(self, other):
+        return Effect(self.keyframes + other.keyframes)
+
+    def render(self, start_frame, fps):
+        frames = []
+        previous = start_frame
+        for duration, frame, fade in self.keyframes:
+            steps = max(1, round(duration * fps))
+            if fade and previous is not None and len(previous) == len(frame):
+                frames += interpolate(previous, frame, steps)
+            else:
+                frames += steps * [frame]
+            previous = frame
+        return frames
+
+
+def hold(frame):
+    return Effect([(0, frame, False)])
+
+
+def fade(frame, duration):
+    return Effect([(duration, frame, True)])
+
+
+def blink(frame, times, period=0.5):
+    off = bytes(len(frame))
+    return Effect(times * [(period / 2, frame, False), (period / 2, off, False)])
+
+
+class FrameClock:
+    """
+    Ticks at a fixed rate on the monotonic clock. Deadlines are scheduled from the start time, not from when
+    the last tick finished, so the clock doesn't drift. If it falls more than a frame behind it skips ahead.
+    """
+    def __init__(self, fps=FPS):
+        self.period = 1 / fps
+        self.start = monotonic()
+        self._next = self.start
+
+    def tick(self):
+        self._next += self.period
+        delay = self._next - monotonic()
+        if delay > 0:
+            sleep(delay)
+        elif -delay > self.period:
+            self._next = monotonic()
+        metrics.frame_lateness_seconds.observe(max(0, monotonic() - self._next))
+        return self._next - self.start
+
+
+class Compositor:
+    """
+    Plays effects on a background thread so blinking and fading never block the caller.
+    Effects are rendered to frames in one batch when submitted and played back against a FrameClock.
+    """
+    def __init__(self, sink, fps=FPS, fade_seconds=FADE_SECONDS, resend_seconds=60):
+        """
+        :param resend_seconds: How often to send the current frame again while nothing changes, so output settings
+                               that change over time (e.g. the night brightness) get applied to it
+        """
+        self.sink = sink
+        self.fps = fps
+        self.fade_seconds = fade_seconds
+        self.resend_seconds = resend_seconds
+
+        self._frames = []
+        self._current = None
+        self._closed = False
+        self._lock = Lock()
+        self._wake = Event()
+        # Set while nothing is left to play
+        self._idle = Event()
+        self._idle.set()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, effect):
+        with self._lock:
+            self._frames = effect.render(self._current, self.fps)
+            self._idle.clear()
+            self._wake.set()
+
+    def show(self, frame, blink_times=0):
+        effect = fade(frame, self.fade_seconds) if self.fade_seconds and self._current else hold(frame)
+        if blink_times:
+            effect = effect.then(blink(frame, blink_times)).then(hold(frame))
+        self.submit(effect)
+
+    def wait_idle(self, timeout=None):
+        """
+        :return: True once every submitted frame was played, False if that didn't happen within timeout (seconds)
+        """
+        return self._idle.wait(timeout)
+
+    def close(self, timeout=10):
+        """
+        Plays out what was already submitted and stops the thread
+        """
+        self.wait_idle(timeout)
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _send(self, frame):
+        # An error from the strip shouldn't stop the thread, the next frame may well get through
+        try:
+            self.sink(frame)
+        except Exception as e:
+            print(f"Couldn't show a frame: {type(e).__name__}: {e}")
+
+    def _run(self):
+        while not self._closed:
+            if not self._wake.wait(self.resend_seconds):
+                if self._current is not None:
+                    self._send(self._current)
+                continue
+            with self._lock:
+                frames, self._frames = self._frames, []
+                self._wake.clear()
+
+            clock = FrameClock(self.fps)
+            played = 0
+            while frames and not self._wake.is_set():
+                # Show the frame for the current time, skipping any that were missed
+                frame = frames[min(played, len(frames) - 1)]
+                self._send(frame)
+                self._current = frame
+                if played >= len(frames) - 1:
+                    break
+                played = round(clock.tick() * self.fps)
+
+            with self._lock:
+                if not self._wake.is_set():
+                    self._idle.set()
@@ -0,0 +1,176 @@
+import os
+from bisect import bisect_left, bisect_right
+from threading import Lock
+from math import sin, cos, tan, asin, atan2, radians, degrees
+from datetime import datetime, timedelta, timezone
+
+J2000 = datetime(2000, 1, 1, 12, tzinfo=timezone.utc)
+
+
+def _days_since_j2000(utc_dt):
+    return (utc_dt - J2000).total_seconds() / 86400
+
+
+def _ecliptic_to_equatorial(lon, lat, obliquity):
+    ra = atan2(sin(lon) * cos(obliquity) - tan(lat) * sin(obliquity), cos(lon))
+    dec = asin(sin(lat) * cos(obliquity) + cos(lat) * sin(obliquity) * sin(lon))
+    return ra, dec
+
+
+def sun_position(days):
+    """
+    Low precision (~0.01 degree) position of the sun from the Astronomical Almanac
+    :param days: Days since J2000
+    :return: Right ascension, declination (radians) and the altitude (degrees) at which it rises/sets
+    """
+    mean_anomaly = radians(357.529 + 0.98560028 * days)
+    mean_lon = 280.459 + 0.98564736 * days
+    lon = radians(mean_lon + 1.915 * sin(mean_anomaly) + 0.020 * sin(2 * mean_anomaly))
+    obliquity = radians(23.439 - 0.00000036 * days)
+    ra, dec = _ecliptic_to_equatorial(lon, 0, obliquity)
+    return ra, dec, -0.833
+
+
+def moon_position(days):
+    """
+    Low precision (~0.3 degree) position of the moon from the Astronomical Almanac
+    :param days: Days since J2000
+    :return: Right ascension, declination (radians) and the altitude (degrees) at which it rises/sets
+    """
+    t = days / 36525
+
+    def s(a, b):
+        return sin(radians(a + b * t))
+
+    def c(a, b):
+        return cos(radians(a + b * t))
+
+    lon = (218.32 + 481267.881 * t + 6.29 * s(135.0, 477198.87) - 1.27 * s(259.3, -413335.36)
+           + 0.66 * s(235.7, 890534.22) + 0.21 * s(269.9, 954397.74) - 0.19 * s(357.5, 35999.05)
+           - 0.11 * s(186.5, 966404.03))
+    lat = 5.13 * s(93.3, 483202.02) + 0.28 * s(228.2, 960400.89) - 0.28 * s(318.3, 6003.15) - 0.17 * s(217.6, -407332.21)
+    parallax = (0.9508 + 0.0518 * c(135.0, 477198.87) + 0.0095 * c(259.3, -413335.36)
+                + 0.0078 * c(235.7, 890534.22) + 0.0028 * c(269.9, 954397.74))
+
+    obliquity = radians(23.439 - 0.00000036 * days)
+    ra, dec = _ecliptic_to_equatorial(radians(lon), radians(lat), obliquity)
+    # Parallax lowers the moon by almost a degree, refraction and its semi-diameter raise it
+    return ra, dec, 0.7275 * parallax - 0.5667
+
+
+def altitude_above_horizon(position, utc_dt, lat, lon):
+    """
+    :return: Degrees the body is above the altitude at which it rises/sets (negative if it's down)
+    """
+    days = _days_since_j2000(utc_dt)
+    ra, dec, horizon = position(days)
+    sidereal_time = radians(280.46061837 + 360.98564736629 * days + lon)
+    hour_angle = sidereal_time - ra
+    lat = radians(lat)
+    altitude = asin(sin(lat) * sin(dec) + cos(lat) * cos(dec) * cos(hour_angle))
+    return degrees(altitude) - horizon
+
+
+def find_events(position, start, end, lat, lon, step=timedelta(minutes=10), precision=timedelta(seconds=15)):
+    """
+    Finds every rise and set between start and end (both UTC)
+    :return: Sorted list of (utc datetime, "rise" or "set")
+    """
+    events = []
+    previous_dt = start
+    previous_alt = altitude_above_horizon(position, start, lat, lon)
+    while previous_dt < end:
+        current_dt = previous_dt + step
+        current_alt = altitude_above_horizon(position, current_dt, lat, lon)
+        if (previous_alt < 0) != (current_alt < 0):
+            low, high = previous_dt, current_dt
+            while high - low > precision:
+                mid = low + (high - low) / 2
+                if (altitude_above_horizon(position, mid, lat, lon) < 0) == (previous_alt < 0):
+                    low = mid
+                else:
+                    high = mid
+            events.append((high, "rise" if previous_alt < 0 else "set"))
+        previous_dt, previous_alt = current_dt, current_alt
+    return events
+
+
+def to_local(utc_dt):
+    return utc_dt.astimezone().replace(tzinfo=None)
+
+
+def to_utc(local_dt):
+    return local_dt.astimezone(timezone.utc)
+
+
+class RiseSetTable:
+    """
+    Precomputed rises and sets of the sun or moon for the coming weeks at a location.
+    Lookups are a bisect and take/return local (naive) datetimes like the rest of the lamp.
+    The table extends itself when a lookup gets close to its end.
+    """
+    def __init__(self, position, lat, lon, days=28):
+        self.position = position
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.days = days
+
+        # (times, events) replaced as a whole, so a lookup never sees the times of one table and the events of another
+        self._table = ([], [])
+        self._end = None
+        self._lock = Lock()
+
+    def _extend(self, local_dt):
+        start = to_utc(local_dt) - timedelta(days=2)
+        end = start + timedelta(days=self.days)
+        events = [(to_local(dt), kind) for dt, kind in find_events(self.position, start, end, self.lat, self.lon)]
+        self._table = ([dt for dt, _ in events], events)
+        self._end = to_local(end)
+
+    def _ensure(self, local_dt):
+        """
+        :return: (times, events) covering local_dt
+        """
+        with self._lock:
+            times = self._table[0]
+            if self._end is None or not times or local_dt < times[0] or local_dt > self._end - timedelta(days=3):
+                self._extend(local_dt)
+            return self._table
+
+    def previous_event(self, local_dt, kind=None):
+        times, events = self._ensure(local_dt)
+        idx = bisect_left(times, local_dt) - 1
+        while idx >= 0 and kind is not None and events[idx][1] != kind:
+            idx -= 1
+        return events[idx] if idx >= 0 else None
+
+    def next_event(self, local_dt, kind=None):
+        times, events = self._ensure(local_dt)
+        idx = bisect_right(times, local_dt)
+        while idx < len(events) and kind is not None and events[idx][1] != kind:
+            idx += 1
+        return events[idx] if idx < len(events) else None
+
+    def is_up(self, local_dt):
+        previous_event = self.previous_event(local_dt)
+        if previous_event is None:
+            return altitude_above_horizon(self.position, to_utc(local_dt), self.lat, self.lon) >= 0
+        return previous_event[1] == "rise"
+
+    def events_between(self, start, end):
+        events = find_events(self.position, to_utc(start), to_utc(end), self.lat, self.lon)
+        return [(to_local(dt), kind) for dt, kind in events]
+
+
+_tables = {}
+
+
+def get_table(body):
+    """
+    :param body: "sun" or "moon"
+    :return: The shared RiseSetTable for LAT/LON
+    """
+    if body not in _tables:
+        position = {"sun": sun_position, "moon": moon_position}[body]
+        _tables[body] = RiseSetTable(position, os.getenv("LAT"), os.getenv("LON"))
+    return _tables[body]
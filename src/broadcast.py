@@ -0,0 +1,66 @@
+from time import sleep
+from threading import Thread, Lock
+from queue import Queue, Full, Empty
+
+
+class Broadcaster:
+    """
+    Reads a single stream on a background thread and fans every item out to any number of subscribers.
+    Reconnects (with backoff) whenever the stream ends or fails.
+    """
+    def __init__(self, connect, max_queue=32, max_backoff=30):
+        """
+        :param connect: Function returning an iterator of items, may raise OSError
+        """
+        self.connect = connect
+        self.max_queue = max_queue
+        self.max_backoff = max_backoff
+        self.latest = None
+
+        self._subscribers = set()
+        self._lock = Lock()
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def subscribe(self):
+        self._start()
+        subscriber = Queue(maxsize=self.max_queue)
+        with self._lock:
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, item):
+        self.latest = item
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(item)
+            except Full:
+                # A slow subscriber only misses old items, it never holds up the others
+                try:
+                    subscriber.get_nowait()
+                except Empty:
+                    pass
+                subscriber.put_nowait(item)
+
+    def _run(self):
+        backoff = 1
+        while True:
+            try:
+                for item in self.connect():
+                    backoff = 1
+                    self.publish(item)
+            except (OSError, RuntimeError):
+                pass
+            sleep(backoff)
+            backoff = min(2 * backoff, self.max_backoff)
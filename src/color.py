@@ -0,0 +1,121 @@
+import os
+from time import monotonic
+from datetime import datetime, timezone
+from src.astro import altitude_above_horizon, sun_position
+
+IDENTITY = bytes(range(256))
+
+
+def build_lut(gamma=1.0, scale=1.0):
+    """
+    :return: 256 byte table mapping a channel value to its gamma corrected and scaled value
+    """
+    return bytes(min(255, round(255 * scale * (v / 255) ** gamma)) for v in range(256))
+
+
+def _float_env(name, default=None):
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        print(f"Ignoring {name}={value!r}, it isn't a number. Using {default} instead.")
+        return default
+
+
+def _floats_env(name, count, default):
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        values = tuple(float(v) for v in value.split(","))
+    except ValueError:
+        values = ()
+    if len(values) != count:
+        print(f"Ignoring {name}={value!r}, it needs to be {count} comma separated numbers. Using {default} instead.")
+        return default
+    return values
+
+
+class ColorPipeline:
+    """
+    Gamma, brightness and white balance for the strip. Applied to whole frames with bytes.translate through
+    a 256-entry lookup table per channel, which is only rebuilt when a setting (or the night brightness) changes.
+    """
+    def __init__(self, gamma=1.0, brightness=1.0, white_balance=(1.0, 1.0, 1.0), night_brightness=None,
+                 lat=None, lon=None, twilight=6, check_every=60):
+        """
+        :param white_balance: Scale of each of the red, green and blue channels
+        :param night_brightness: Brightness (relative to brightness) once the sun is twilight degrees below the
+                                 horizon, dimming gradually from sunset. None to keep the same brightness at night.
+        :param check_every: How often, in seconds, to work out the night brightness again
+        """
+        self.gamma = gamma
+        self.brightness = brightness
+        self.white_balance = tuple(white_balance)
+        self.night_brightness = night_brightness
+        self.lat = lat
+        self.lon = lon
+        self.twilight = twilight
+        self.check_every = check_every
+
+        self._night_factor = 1.0
+        self._checked_at = None
+        self._settings = None
+        self._lut = None
+        self._channel_luts = None
+
+    @classmethod
+    def from_env(cls):
+        return cls(gamma=_float_env("LED_GAMMA", 1.0),
+                   brightness=_float_env("LED_BRIGHTNESS", 1.0),
+                   white_balance=_floats_env("LED_WHITE_BALANCE", 3, (1.0, 1.0, 1.0)),
+                   night_brightness=_float_env("LED_NIGHT_BRIGHTNESS"),
+                   lat=_float_env("LAT"),
+                   lon=_float_env("LON"))
+
+    def night_factor(self, utc_dt=None):
+        """
+        :param utc_dt: Timezone aware UTC datetime (default=now)
+        :return: How much to dim for the time of day, from 1 while the sun is up down to night_brightness
+        """
+        if self.night_brightness is None or self.lat is None or self.lon is None:
+            return 1.0
+        altitude = altitude_above_horizon(sun_position, utc_dt or datetime.now(timezone.utc), self.lat, self.lon)
+        daylight = min(1.0, max(0.0, (altitude + self.twilight) / self.twilight))
+        return self.night_brightness + (1 - self.night_brightness) * daylight
+
+    def _update(self):
+        if self._checked_at is None or monotonic() - self._checked_at >= self.check_every:
+            self._checked_at = monotonic()
+            # Rounded so the tables aren't rebuilt for changes too small to see
+            self._night_factor = round(self.night_factor(), 2)
+
+        settings = (self.gamma, self.brightness * self._night_factor, self.white_balance)
+        if settings != self._settings:
+            gamma, brightness, white_balance = settings
+            luts = [build_lut(gamma, brightness * scale) for scale in white_balance]
+            if luts[0] == luts[1] == luts[2]:
+                # Every channel is the same, so the whole frame can be translated at once (or left as it is)
+                self._lut = None if luts[0] == IDENTITY else luts[0]
+                self._channel_luts = None
+            else:
+                self._lut = None
+                self._channel_luts = luts
+            self._settings = settings
+
+    def apply(self, frame):
+        """
+        :param frame: Flat RGB bytes
+        :return: The corrected frame
+        """
+        self._update()
+        if self._lut is not None:
+            return frame.translate(self._lut)
+        if self._channel_luts is None:
+            return frame
+        out = bytearray(len(frame))
+        for channel, lut in enumerate(self._channel_luts):
+            out[channel::3] = frame[channel::3].translate(lut)
+        return bytes(out)
@@ -0,0 +1,152 @@
+import os
+import sys
+import json
+import click
+import socket
+import atexit
+from threading import Thread
+from socketserver import ThreadingUnixStreamServer, StreamRequestHandler
+
+SOCKET_PATH = os.getenv("CONTROL_SOCKET", "./moonlamp.sock")
+
+
+class _Handler(StreamRequestHandler):
+    def _send(self, response):
+        self.wfile.write(json.dumps(response, default=str).encode() + b"\n")
+        self.wfile.flush()
+
+    def _stream(self, stream):
+        try:
+            for item in stream:
+                if item is None:
+                    # Heartbeat, also how a client that went away is noticed
+                    self.wfile.write(b"\n")
+                    self.wfile.flush()
+                else:
+                    self._send({"ok": True, "result": item})
+        except OSError:
+            pass
+        finally:
+            stream.close()
+
+    def handle(self):
+        # One JSON object per line in each direction
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+                cmd = request.pop("cmd")
+                if cmd in self.server.streams:
+                    # Streams keep sending results until the client disconnects
+                    return self._stream(self.server.streams[cmd](**request))
+                handler = self.server.handlers[cmd]
+                response = {"ok": True, "result": handler(**request)}
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self._send(response)
+
+
+class ControlServer:
+    """
+    Unix domain socket the set_lamp daemon listens on so flask_app.py can query and control it.
+    Commands are registered with a handler whose return value is sent back as the result.
+    """
+    def __init__(self, path=SOCKET_PATH):
+        self.path = path
+        self.handlers = {}
+        self.streams = {}
+        self._server = None
+
+    def register(self, cmd, handler):
+        self.handlers[cmd] = handler
+
+    def register_stream(self, cmd, stream):
+        """
+        :param stream: Generator function, each item it yields is sent to the client (None sends a heartbeat)
+        """
+        self.streams[cmd] = stream
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = ThreadingUnixStreamServer(self.path, _Handler)
+        self._server.daemon_threads = True
+        self._server.handlers = self.handlers
+        self._server.streams = self.streams
+        # The daemon runs as root but the web app doesn't
+        os.chmod(self.path, 0o666)
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+def send_command(cmd, path=SOCKET_PATH, timeout=15, **kwargs):
+    """
+    Sends a command to the running daemon
+    :return: The command's result
+    :raises OSError: If the daemon isn't running
+    :raises RuntimeError: If the command failed
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"cmd": cmd, **kwargs}).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("The lamp closed the connection")
+    response = json.loads(line)
+    if not response["ok"]:
+        raise RuntimeError(response["error"])
+    return response["result"]
+
+
+def stream_command(cmd, path=SOCKET_PATH, timeout=60, **kwargs):
+    """
+    Generator of the results of a streaming command
+    :param timeout: Seconds without anything (including heartbeats) before giving up
+    :raises OSError: If the daemon isn't running or goes away
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"cmd": cmd, **kwargs}).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                response = json.loads(line)
+                if not response["ok"]:
+                    raise RuntimeError(response["error"])
+                yield response["result"]
+    raise ConnectionError("The lamp closed the connection")
+
+
+@click.command()
+@click.option('-s', '--screen', multiple=True, help='Screen to show (see src/possible_screens.py')
+@click.option('-d', '--delay', type=int, help='How long, in seconds, to show each screen')
+@click.option('-m', '--mode', help='Which mode to use')
+@click.option('-t', '--timer-length', type=int, help='How long to leave the lamp on in timer mode')
+def set_running_lamp(screen, delay, mode, timer_length):
+    """
+    Changes the settings of the running lamp, exits with 1 if it isn't running and 2 if it rejected the change
+    """
+    try:
+        applied = send_command("set", mode=mode, delay=delay, timer_length=timer_length, screens=list(screen) or None)
+    except OSError as e:
+        print(f"Couldn't reach the running lamp: {e}")
+        sys.exit(1)
+    except RuntimeError as e:
+        print(f"The running lamp rejected the change: {e}")
+        sys.exit(2)
+    print("Applied" if applied else "Queued")
+
+
+if __name__ == "__main__":
+    set_running_lamp()
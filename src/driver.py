@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+The only part of the lamp that needs root. Pushes the frames the lamp daemon writes to the shared frame ring
+(LED_DRIVER=shm) to the strip, so fetching and rendering never delay a write and can run as a normal user.
+
+    sudo python3 -m src.driver
+"""
+import os
+import sys
+import click
+import signal
+from time import sleep, monotonic
+from dotenv import load_dotenv
+from src.hardware import open_strip
+from src.frame_ring import FrameRing, RING_PATH
+
+load_dotenv(override=True)
+
+
+def open_ring(path, poll):
+    """
+    Waits for the lamp daemon to create the ring
+    """
+    while True:
+        try:
+            return FrameRing.open(path)
+        except (FileNotFoundError, ValueError):
+            sleep(poll)
+
+
+@click.command()
+@click.option('--ring', default=RING_PATH, help=f'Frame ring to read (default={RING_PATH})')
+@click.option('--poll', default=0.004, help='How often, in seconds, to check for a new frame while frames are '
+                                           'coming in (default=0.004)')
+@click.option('--idle-poll', default=0.1, help='How often, in seconds, to check for a new frame once none has come '
+                                               'in for a second (default=0.1)')
+def driver(ring, poll, idle_poll):
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    reverse_leds = os.getenv("REVERSE_LEDS") == 'True'
+
+    frame_ring = open_ring(ring, idle_poll)
+    framebuffer = open_strip(frame_ring.num_leds, reverse_leds)
+    shown = 0
+    frame_at = checked_at = monotonic()
+    while True:
+        latest = frame_ring.latest(after=shown)
+        if latest is not None:
+            # Only the newest frame matters, any missed in between are skipped
+            shown, _, frame = latest
+            framebuffer.commit_frame(frame)
+            frame_at = monotonic()
+            continue
+
+        now = monotonic()
+        if now - checked_at >= 1:
+            # The lamp creates a new ring whenever it restarts
+            checked_at = now
+            if frame_ring.replaced():
+                frame_ring.close()
+                frame_ring = open_ring(ring, idle_poll)
+                shown = 0
+                if frame_ring.num_leds != framebuffer.num_leds:
+                    framebuffer.pixels.deinit()
+                    framebuffer = open_strip(frame_ring.num_leds, reverse_leds)
+        # Keep up with animations while frames are coming in, but don't keep the CPU busy when the lamp is quiet
+        # (which is most of the time, between screens)
+        sleep(poll if now - frame_at < 1 else idle_poll)
+
+
+if __name__ == "__main__":
+    driver()
@@ -0,0 +1,73 @@
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+
+class Forecast:
+    """
+    Hourly forecast from weatherapi.com parsed once into typed columns, one value per hour.
+    Lookups by time are a binary search of the time_epoch column, so the raw payload doesn't need to be kept around.
+    The hours aren't assumed to be evenly spaced, weatherapi.com lists 24 local hours a day even when the clocks
+    change.
+    """
+    columns = {
+        "time_epoch": 'q',
+        "cloud": 'B',
+        "feels_like": 'd',
+        "chance_of_rain": 'B',
+        "chance_of_snow": 'B',
+        "precip_mm": 'd',
+    }
+
+    def __init__(self, current, **columns):
+        self.current = current
+        for name, typecode in self.columns.items():
+            setattr(self, name, array(typecode, columns.get(name, [])))
+
+    @classmethod
+    def from_json(cls, weather):
+        hours = [hour for day in weather["forecast"]["forecastday"] for hour in day["hour"]]
+        columns = {
+            "time_epoch": [h["time_epoch"] for h in hours],
+            "cloud": [int(h["cloud"]) for h in hours],
+            "feels_like": [h["feelslike_f"] for h in hours],
+            "chance_of_rain": [int(h["chance_of_rain"]) for h in hours],
+            "chance_of_snow": [int(h["chance_of_snow"]) for h in hours],
+            "precip_mm": [h["precip_mm"] for h in hours],
+        }
+        current = {
+            "cloud": weather["current"]["cloud"],
+            "feels_like": weather["current"]["feelslike_f"],
+        }
+        return cls(current, **columns)
+
+    def __len__(self):
+        return len(self.time_epoch)
+
+    def index(self, dt):
+        """
+        :param dt: Local datetime, rounded to the nearest hour
+        :return: The index of that hour or None if it's not in the forecast
+        """
+        # The first hour within half an hour of dt
+        epoch = dt.timestamp()
+        idx = bisect_left(self.time_epoch, epoch - 1800)
+        return idx if idx < len(self) and self.time_epoch[idx] < epoch + 1800 else None
+
+    def timestamp(self, idx):
+        return datetime.fromtimestamp(self.time_epoch[idx])
+
+    def at(self, column, dt):
+        idx = self.index(dt)
+        if idx is None:
+            raise ValueError(f"{dt} is not in the forecast")
+        return getattr(self, column)[idx]
+
+    def window_max(self, column, dt, hours):
+        """
+        :return: The max of column over the hours starting at (the hour nearest to) dt
+        """
+        idx = self.index(dt)
+        if idx is None:
+            raise ValueError(f"{dt} is not in the forecast")
+        return max(getattr(self, column)[idx:idx + hours])
@@ -0,0 +1,121 @@
+"""
+Frames shared between processes through a memory-mapped file (in /dev/shm, so it never touches the disk).
+With LED_DRIVER=shm the lamp daemon writes every frame it shows to the ring, while the pixel driver
+(src/driver.py) and flask_app.py read the newest one straight from memory.
+"""
+import os
+import mmap
+import struct
+from time import time
+
+RING_PATH = os.getenv("LED_RING_PATH", "/dev/shm/moonlamp-frames")
+
+MAGIC = b"MLFR"
+VERSION = 1
+# magic, version, number of LEDs, number of slots
+HEADER = struct.Struct("<4sHHI")
+# Frames written so far, right after the header
+COUNT = struct.Struct("<Q")
+# Sequence number (odd while the slot is being written) and when the frame was written
+SLOT_HEADER = struct.Struct("<Qd")
+
+
+class FrameRing:
+    """
+    Ring of frame slots with a single writer and any number of readers. Frame n (counting from 1) goes in
+    slot (n - 1) % slots, whose sequence number is 2n - 1 while it's written and 2n once it's complete,
+    so readers can tell they raced the writer and try again without any locking between processes.
+    """
+    def __init__(self, path, mm, num_leds, slots, inode):
+        self.path = path
+        self.num_leds = num_leds
+        self.slots = slots
+        self._mm = mm
+        self._inode = inode
+        self._slot_size = SLOT_HEADER.size + 3 * num_leds
+
+    @staticmethod
+    def size(num_leds, slots):
+        return HEADER.size + COUNT.size + slots * (SLOT_HEADER.size + 3 * num_leds)
+
+    @classmethod
+    def create(cls, num_leds, path=RING_PATH, slots=8):
+        """
+        Creates a new, empty ring replacing any old one. Readers of the old ring notice with replaced().
+        """
+        tmp_path = f"{path}.{os.getpid()}"
+        size = cls.size(num_leds, slots)
+        fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            mm = mmap.mmap(fd, size)
+            inode = os.fstat(fd).st_ino
+        finally:
+            os.close(fd)
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, num_leds, slots)
+        # Readers only ever find a fully set up ring
+        os.replace(tmp_path, path)
+        return cls(path, mm, num_leds, slots, inode)
+
+    @classmethod
+    def open(cls, path=RING_PATH):
+        """
+        Opens an existing ring read-only
+        :raises FileNotFoundError: If the lamp hasn't created the ring yet
+        """
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            inode = os.fstat(f.fileno()).st_ino
+        magic, version, num_leds, slots = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION or len(mm) != cls.size(num_leds, slots):
+            mm.close()
+            raise ValueError(f"{path} isn't a frame ring")
+        return cls(path, mm, num_leds, slots, inode)
+
+    def _slot_offset(self, number):
+        return HEADER.size + COUNT.size + ((number - 1) % self.slots) * self._slot_size
+
+    def count(self):
+        return COUNT.unpack_from(self._mm, HEADER.size)[0]
+
+    def write(self, frame):
+        """
+        :param frame: Flat RGB bytes in display order
+        """
+        if len(frame) != 3 * self.num_leds:
+            raise ValueError(f"Expecting {3 * self.num_leds} bytes not {len(frame)}")
+        number = self.count() + 1
+        offset = self._slot_offset(number)
+        SLOT_HEADER.pack_into(self._mm, offset, 2 * number - 1, 0)
+        self._mm[offset + SLOT_HEADER.size:offset + self._slot_size] = frame
+        SLOT_HEADER.pack_into(self._mm, offset, 2 * number, time())
+        COUNT.pack_into(self._mm, HEADER.size, number)
+
+    def latest(self, after=0):
+        """
+        :param after: Only return a frame newer than this frame number
+        :return: (frame number, time written, frame) or None if there's no (newer) frame
+        """
+        for _ in range(self.slots):
+            number = self.count()
+            if number <= after:
+                return None
+            offset = self._slot_offset(number)
+            sequence, written_at = SLOT_HEADER.unpack_from(self._mm, offset)
+            frame = self._mm[offset + SLOT_HEADER.size:offset + self._slot_size]
+            if sequence == 2 * number and SLOT_HEADER.unpack_from(self._mm, offset)[0] == sequence:
+                return number, written_at, frame
+        # The writer kept overwriting the slot, very unlikely with any number of slots
+        return None
+
+    def replaced(self):
+        """
+        :return: True if the lamp has since created a new ring (e.g. it restarted), open() it again to follow
+        """
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return True
+
+    def close(self):
+        self._mm.close()
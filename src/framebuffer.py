@@ -0,0 +1,82 @@
+from time import perf_counter
+from src import metrics
+
+
+class FrameBuffer:
+    """
+    Keeps the last frame committed to the strip so unchanged frames skip pixels.show()
+    and only the pixels that changed are written.
+    """
+    def __init__(self, pixels, num_leds, pixel_order="RGB", reverse_leds=False, color=None):
+        """
+        :param color: Optional ColorPipeline applied to every frame before it's written
+        """
+        self.pixels = pixels
+        self.num_leds = num_leds
+        self.pixel_order = pixel_order
+        self.reverse_leds = reverse_leds
+        self.color = color
+
+        channel_order = [1, 0, 2] if pixel_order == "GRB" else [0, 1, 2]
+        if reverse_leds:
+            # Reversing the whole frame also reverses the channels within each pixel
+            channel_order = [2 - c for c in channel_order]
+        # (destination channel, source channel) pairs applied to the whole frame at once
+        self._channel_map = list(enumerate(channel_order))
+        self._committed = None
+
+    def to_hardware_order(self, frame):
+        if self.reverse_leds:
+            frame = frame[::-1]
+        out = bytearray(len(frame))
+        for dst, src in self._channel_map:
+            out[dst::3] = frame[src::3]
+        return out
+
+    def _changed_ranges(self, frame, block=16):
+        """
+        :return: (start, end) LED ranges that differ from the committed frame. Blocks of LEDs are compared
+                 as whole slices first, so only the blocks that changed are walked LED by LED.
+        """
+        if self._committed is None:
+            return [(0, self.num_leds)]
+
+        ranges = []
+        start = None
+        for block_start in range(0, self.num_leds, block):
+            block_end = min(block_start + block, self.num_leds)
+            if frame[3*block_start:3*block_end] == self._committed[3*block_start:3*block_end]:
+                if start is not None:
+                    ranges.append((start, block_start))
+                    start = None
+                continue
+            for i in range(block_start, block_end):
+                changed = frame[3*i:3*i + 3] != self._committed[3*i:3*i + 3]
+                if changed and start is None:
+                    start = i
+                elif not changed and start is not None:
+                    ranges.append((start, i))
+                    start = None
+        if start is not None:
+            ranges.append((start, self.num_leds))
+        return ranges
+
+    def commit_frame(self, frame):
+        """
+        :param frame: Flat RGB bytes in display order
+        :return: True if anything was written to the strip
+        """
+        if self.color is not None:
+            frame = self.color.apply(frame)
+        frame = self.to_hardware_order(frame)
+        if frame == self._committed:
+            return False
+
+        write_start = perf_counter()
+        for start, end in self._changed_ranges(frame):
+            chunk = frame[3*start:3*end]
+            self.pixels[start:end] = [tuple(chunk[i:i + 3]) for i in range(0, len(chunk), 3)]
+        self.pixels.show()
+        metrics.hardware_write_seconds.observe(perf_counter() - write_start)
+        self._committed = frame
+        return True
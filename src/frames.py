@@ -0,0 +1,106 @@
+"""
+Helpers that build frames for any number of LEDs.
+A frame is flat RGB bytes (3 per LED) built with whole-strip bytes operations rather than per-LED loops.
+"""
+BLACK = (0, 0, 0)
+
+
+def from_colors(colors):
+    return bytes(v for color in colors for v in color)
+
+
+def to_colors(frame):
+    return [tuple(frame[i:i + 3]) for i in range(0, len(frame), 3)]
+
+
+def scale(color, fraction):
+    return tuple(int(fraction * v) for v in color)
+
+
+def blend(a, b, fraction):
+    """
+    :return: The color fraction of the way from a to b
+    """
+    return tuple(round(x + (y - x) * fraction) for x, y in zip(a, b))
+
+
+def solid(num_leds, color):
+    return bytes(color) * num_leds
+
+
+def fill(num_leds, count, color, background=BLACK):
+    """
+    :return: The first count LEDs set to color and the rest to background
+    """
+    count = max(0, min(num_leds, count))
+    return bytes(color) * count + bytes(background) * (num_leds - count)
+
+
+def edge(num_leds, count, color, background=BLACK):
+    """
+    Like fill, but count can be fractional: the LED on the edge is blended between color and background
+    """
+    count = max(0, min(num_leds, count))
+    full_leds = int(count)
+    frame = bytes(color) * full_leds
+    if full_leds < num_leds:
+        frame += bytes(blend(background, color, count - full_leds))
+    return frame + bytes(background) * (num_leds - len(frame) // 3)
+
+
+def bar(num_leds, value, color, maximum=1, background=BLACK, min_partial=0):
+    """
+    Bar graph where the LED at the end of the bar is lit proportionally to how much of it is filled
+    :param value: How much of the strip to fill, from 0 to maximum
+    :param min_partial: Minimum brightness of the end LED when the bar is empty, so it's never all dark
+    """
+    filled = max(0, min(maximum, value)) / (maximum / num_leds)
+    full_leds = int(filled)
+    partial = filled - full_leds
+    if full_leds == 0 and partial < min_partial:
+        partial = min_partial
+
+    frame = bytes(color) * full_leds
+    if partial > 0 and full_leds < num_leds:
+        frame += bytes(scale(color, partial))
+    return frame + bytes(background) * (num_leds - len(frame) // 3)
+
+
+def pattern(num_leds, colors):
+    """
+    :return: colors repeated to fill the strip
+    """
+    unit = from_colors(colors)
+    repeats = -(-num_leds // len(colors))
+    return (unit * repeats)[:3 * num_leds]
+
+
+def stretch(num_leds, colors):
+    """
+    :return: The strip split into equal blocks, one per color (e.g. two colors make two halves)
+    """
+    frame = b""
+    for i, color in enumerate(colors):
+        end = (i + 1) * num_leds // len(colors)
+        frame += bytes(color) * (end - len(frame) // 3)
+    return frame
+
+
+def moon(num_leds, phase_fraction, lit, dark):
+    """
+    Lights up the part of the strip the moon is lit on, waxing from the end of the strip and waning from the start.
+    The LED on the edge of the lit part is lit proportionally.
+    :param phase_fraction: How far through the lunar cycle, from 0 (new) to 1
+    """
+    if phase_fraction <= 0.5:
+        lit_leds = num_leds * phase_fraction * 2
+        return edge(num_leds, num_leds - lit_leds, dark, background=lit)
+    lit_leds = num_leds * (1 - phase_fraction) * 2
+    return edge(num_leds, lit_leds, lit, background=dark)
+
+
+def moon_table(num_leds, lit, dark, bins=1024):
+    """
+    :return: Moon frame for each of bins equal steps through the lunar cycle, bin i shows phase fraction i / bins
+    """
+    return [moon(num_leds, i / bins, lit, dark) for i in range(bins)]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Renders every screen in possible_screens across a grid of inputs (moon phases, cloudiness, temperatures,
+precipitation and game states) through the print-only path, spread over a process pool. Writes a PNG per frame
+and/or an HTML contact sheet, and reports how many frames per second were rendered.
+
+    python -m src.gallery -o gallery -n 6 -n 60
+"""
+import os
+import sys
+import html
+import click
+from time import perf_counter
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+# Set up once per worker process by _init_worker
+_lamps = {}
+_shown = []
+
+
+def inputs():
+    """
+    Generator of (screen name, kwargs for its show method)
+    """
+    yield from (("current_moon_screen", {"phase_number": phase_number}) for phase_number in range(12))
+    yield from (("current_moon_screen", {"phase_fraction": i / 128}) for i in range(128))
+    yield from (("sunniness_screen", {"cloudiness": cloudiness}) for cloudiness in range(101))
+    # A few degrees past each end, which are shown with a pattern
+    yield from (("feels_like_screen", {"feels_like": feels_like}) for feels_like in range(-15, 136))
+    for precip_type in ("rain", "snow"):
+        for precip_percent in range(0, 101, 5):
+            for precip_amount in (1.0, 5.0, 10.0):
+                yield "daily_precip_screen", {"precip_percent": precip_percent, "precip_type": precip_type,
+                                              "precip_amount": precip_amount}
+    yield from (("game_today", {"game": game}) for game in ("D", "N", "no_game"))
+    yield "ukraine_flag", {}
+    yield "error_screen", {}
+
+
+def file_name(screen_name, kwargs, num_leds):
+    parts = [screen_name] + [f"{k}_{v}" for k, v in kwargs.items()] + [f"{num_leds}_leds"]
+    return "-".join(parts) + ".png"
+
+
+def _init_worker():
+    from src.history import history
+
+    # Nothing but the frames is wanted from the workers: no printing and no lamp.txt/lamp_html.txt
+    sys.stdout = open(os.devnull, "w")
+    history.text_path = history.html_path = None
+    history.add_listener(_shown.append)
+
+
+def _lamp(lamp_class, num_leds):
+    key = (lamp_class, num_leds)
+    if key not in _lamps:
+        _lamps[key] = lamp_class(print_only=True, reverse_leds=False, num_leds=num_leds)
+    return _lamps[key]
+
+
+def render_batch(jobs, png_dir=None):
+    """
+    Runs in a worker
+    :param jobs: List of (screen name, kwargs, number of LEDs)
+    :param png_dir: Where to write a PNG of each frame (default=don't)
+    :return: List of (screen name, kwargs, number of LEDs, frame, extra_info), frame is None if nothing was shown
+    """
+    import src.possible_screens as ps
+    from src.render import render_png
+
+    results = []
+    for screen_name, kwargs, num_leds in jobs:
+        screen = getattr(ps, screen_name)
+        lamp = _lamp(screen.obj.lamp_class, num_leds)
+        del _shown[:]
+        getattr(lamp, screen.method)(**{**screen.kwargs, **kwargs})
+        frame = _shown[-1] if _shown else None
+        if frame is not None and png_dir is not None:
+            with open(os.path.join(png_dir, file_name(screen_name, kwargs, num_leds)), "wb") as f:
+                f.write(render_png(frame.colors))
+        results.append((screen_name, kwargs, num_leds,
+                        frame and frame.colors, frame and frame.extra_info))
+    return results
+
+
+def render_all(num_leds, workers=None, png_dir=None, batch_size=64):
+    """
+    Renders every input for each number of LEDs
+    :return: Results in the same order as the inputs (see render_batch)
+    """
+    jobs = [(screen_name, kwargs, n) for n in num_leds for screen_name, kwargs in inputs()]
+    batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        return [r for batch in executor.map(partial(render_batch, png_dir=png_dir), batches) for r in batch]
+
+
+def contact_sheet(results):
+    """
+    :return: HTML page with every frame, grouped by screen and number of LEDs
+    """
+    from src.render import html_cell
+
+    sections = []
+    group = None
+    for screen_name, kwargs, num_leds, frame, extra_info in results:
+        if (screen_name, num_leds) != group:
+            group = (screen_name, num_leds)
+            sections.append(f"<h2>{screen_name} ({num_leds} LEDs)</h2>")
+        label = ", ".join(f"{k}={v}" for k, v in kwargs.items())
+        if frame is None:
+            leds = "<i>nothing shown</i>"
+        else:
+            leds = "".join(html_cell(frame[i:i + 3]) for i in range(0, len(frame), 3))
+        sections.append(f'<div style="font-family:monospace;">{leds} {label} {html.escape(extra_info or "")}</div>')
+    return "<html><body>\n" + "\n".join(sections) + "\n</body></html>\n"
+
+
+@click.command()
+@click.option('-o', '--output-dir', default="gallery", help='Where to write the images and contact sheet')
+@click.option('-n', '--num-leds', multiple=True, type=int,
+              help='Number of LEDs to render for, can be repeated (default=NUM_LEDS)')
+@click.option('-w', '--workers', type=int, help='Worker processes (default=one per CPU)')
+@click.option('--png/--no-png', default=True, help='Write a PNG of every frame')
+@click.option('--sheet/--no-sheet', default=True, help='Write an HTML contact sheet (index.html)')
+def gallery(output_dir, num_leds, workers, png, sheet):
+    num_leds = num_leds or [int(os.getenv("NUM_LEDS", 6))]
+    # The lamps need it set to be imported at all
+    os.environ.setdefault("NUM_LEDS", str(num_leds[0]))
+    os.makedirs(output_dir, exist_ok=True)
+
+    start = perf_counter()
+    results = render_all(num_leds, workers=workers, png_dir=output_dir if png else None)
+    elapsed = perf_counter() - start
+    print(f"Rendered {len(results)} frames in {elapsed:.2f}s ({len(results) / elapsed:.0f} frames/s)")
+
+    if sheet:
+        with open(os.path.join(output_dir, "index.html"), "w") as f:
+            f.write(contact_sheet(results))
+
+
+if __name__ == "__main__":
+    gallery()
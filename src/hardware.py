@@ -0,0 +1,51 @@
+import os
+import atexit
+from src.framebuffer import FrameBuffer
+from src.animation import Compositor
+from src.color import ColorPipeline
+
+# "neopixel" drives the strip from this process (needs root),
+# "shm" hands the frames to the pixel driver process (src/driver.py) through a shared frame ring
+LED_DRIVER = os.getenv("LED_DRIVER", "neopixel")
+
+_framebuffer = None
+_compositor = None
+
+
+def open_strip(num_leds, reverse_leds):
+    """
+    Opens the strip on D18, which needs root
+    """
+    import board
+    import neopixel
+
+    pixel_pin = board.D18
+    pixel_order = neopixel.GRB
+
+    # Brightness is left to the ColorPipeline, which is much cheaper than neopixel scaling every pixel
+    pixels = neopixel.NeoPixel(pixel_pin, num_leds, brightness=1,
+                               auto_write=False, pixel_order=pixel_order)
+    return FrameBuffer(pixels, num_leds, pixel_order, reverse_leds, ColorPipeline.from_env())
+
+
+def get_framebuffer(num_leds, reverse_leds):
+    """
+    Opens the strip the first time it's needed. Every lamp drives the same strip, so they all share it.
+    :return: The strip's FrameBuffer, or None if another process drives the strip (LED_DRIVER=shm)
+    """
+    global _framebuffer, _compositor
+    if _compositor is None:
+        if LED_DRIVER == "shm":
+            from src.frame_ring import FrameRing
+
+            _compositor = Compositor(FrameRing.create(num_leds).write)
+        else:
+            _framebuffer = open_strip(num_leds, reverse_leds)
+            _compositor = Compositor(_framebuffer.commit_frame)
+        # Frames submitted right before exiting still get to the strip
+        atexit.register(_compositor.close)
+    return _framebuffer
+
+
+def get_compositor():
+    return _compositor
@@ -0,0 +1,134 @@
+import os
+import atexit
+from threading import RLock
+from queue import Queue, Empty, Full
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timedelta
+from src.frames import to_colors
+
+# colors is the frame as flat RGB bytes
+Frame = namedtuple("Frame", ["div_id", "timestamp", "colors", "extra_info", "text", "html"])
+
+
+def frame_as_dict(frame):
+    if frame is None:
+        return None
+    return {
+        "div_id": frame.div_id,
+        "timestamp": str(frame.timestamp),
+        "colors": to_colors(frame.colors),
+        "extra_info": frame.extra_info,
+    }
+
+
+class LampHistory:
+    """
+    Bounded, in-memory history of the most recent frame shown by each screen (keyed by div_id).
+    Frames older than max_age are dropped and the files read by watch_lamp.sh and flask_app.py
+    are only rewritten every flush_every seconds (or on flush()/exit) instead of on every frame.
+    With text_path set to None nothing is written, the history is only kept in memory.
+    """
+    def __init__(self,
+                 text_path="./lamp.txt",
+                 html_path="./lamp_html.txt",
+                 max_age=timedelta(minutes=15),
+                 max_entries=32,
+                 flush_every=timedelta(seconds=float(os.getenv("HISTORY_FLUSH_SECONDS", 30)))):
+        self.text_path = text_path
+        self.html_path = html_path
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+
+        self._frames = OrderedDict()
+        self._last_frame = None
+        self._dirty = False
+        self._flushed_at = datetime.now()
+        self._lock = RLock()
+        self._listeners = []
+
+    def add(self, frame):
+        with self._lock:
+            if frame.div_id == "leds_off":
+                # Turning the lamp off clears what was shown before
+                self._frames.clear()
+            # Assigning to an existing key keeps its position, like replacing the line in place
+            self._frames[frame.div_id] = frame
+            while len(self._frames) > self.max_entries:
+                self._frames.popitem(last=False)
+            self._last_frame = frame
+            self._dirty = True
+
+            if frame.div_id == "leds_off" or frame.timestamp - self._flushed_at >= self.flush_every:
+                self.flush()
+
+        for listener in list(self._listeners):
+            listener(frame)
+
+    def add_listener(self, listener):
+        """
+        :param listener: Called with every frame as it's added, must not block
+        """
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def subscribe(self, heartbeat=15):
+        """
+        Generator of every new frame (as a dict). Yields None after heartbeat seconds without a frame.
+        Frames are dropped if the consumer falls too far behind.
+        """
+        frames = Queue(maxsize=64)
+
+        def listener(frame):
+            try:
+                frames.put_nowait(frame)
+            except Full:
+                pass
+
+        self.add_listener(listener)
+        try:
+            while True:
+                try:
+                    yield frame_as_dict(frames.get(timeout=heartbeat))
+                except Empty:
+                    yield None
+        finally:
+            self.remove_listener(listener)
+
+    def _expire(self, current_dt=None):
+        current_dt = current_dt or datetime.now()
+        expired = [k for k, v in self._frames.items() if current_dt - v.timestamp > self.max_age]
+        for k in expired:
+            del self._frames[k]
+
+    def frames(self):
+        with self._lock:
+            self._expire()
+            return list(self._frames.values())
+
+    def last_frame(self):
+        return self._last_frame
+
+    def html(self):
+        return "\n".join(f.html for f in self.frames())
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty or self.text_path is None:
+                return
+            html = self.html()
+            with open(self.text_path, "w") as f:
+                f.write(self._last_frame.text)
+                f.write("\n")
+            with open(self.html_path, "w") as f:
+                f.write(html)
+                f.write("\n")
+            self._dirty = False
+            self._flushed_at = datetime.now()
+
+
+history = LampHistory()
+atexit.register(history.flush)
@@ -0,0 +1,177 @@
+import os
+import re
+import json
+import socket
+from time import monotonic
+from threading import Lock, Timer
+from collections import OrderedDict
+from urllib.parse import urlsplit
+from datetime import datetime, timedelta
+from src import metrics
+
+TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+
+
+def _shutdown(sock):
+    # Makes a read blocked on the socket fail straight away. If the socket was closed meanwhile this only raises.
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class CachedResponse:
+    def __init__(self, data, etag=None, last_modified=None, expires_at=None):
+        self.data = data
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    def is_fresh(self):
+        return self.expires_at is not None and datetime.utcnow() < self.expires_at
+
+    def is_useless(self):
+        """
+        :return: True once it's expired and there's nothing to revalidate it with
+        """
+        return not self.is_fresh() and not self.etag and not self.last_modified
+
+
+def _expires_at(headers):
+    cache_control = headers.get("Cache-Control", "")
+    if "no-store" in cache_control or "no-cache" in cache_control:
+        return None
+    max_age = re.search(r"max-age=(\d+)", cache_control)
+    if max_age:
+        return datetime.utcnow() + timedelta(seconds=int(max_age.group(1)))
+    return None
+
+
+class HttpClient:
+    """
+    Shared HTTP client for all the external APIs. Keeps a pooled keep-alive session per host, makes conditional
+    requests (ETag/Last-Modified) so unchanged payloads come back as 304s and honors Cache-Control max-age.
+    The cache holds at most cache_size responses, least recently used first out.
+    """
+    def __init__(self, timeout=TIMEOUT, pool_size=4, cache_size=16):
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.cache_size = cache_size
+
+        self._sessions = {}
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    def _session(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                from requests import Session
+                from requests.adapters import HTTPAdapter
+
+                session = Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers["Accept-Encoding"] = "gzip, deflate"
+                self._sessions[host] = session
+        return session
+
+    def get_json(self, url, params=None, timeout=None, parse=None):
+        """
+        :param timeout: Longest the whole request can take in seconds, including reading the body
+                        (default=HTTP_TIMEOUT)
+        :param parse: Function turning the JSON into what's returned. Only its result is cached, so the raw
+                      payload isn't kept around between requests.
+        """
+        key = (url, tuple(sorted((params or {}).items())))
+        host = urlsplit(url).netloc
+        cached = self._cache_get(key)
+        if cached is not None and cached.is_fresh():
+            metrics.http_requests.inc(host=host, result="cached")
+            return cached.data
+
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+
+        timeout = timeout or self.timeout
+        deadline = monotonic() + timeout
+        with self._session(url).get(url, params=params, headers=headers, timeout=timeout, stream=True) as res:
+            if res.status_code == 304 and cached is not None:
+                cached.expires_at = _expires_at(res.headers)
+                metrics.http_requests.inc(host=host, result="not_modified")
+                return cached.data
+            res.raise_for_status()
+            data = json.loads(self._read(res, deadline))
+        metrics.http_requests.inc(host=host, result="fetched")
+
+        if parse is not None:
+            data = parse(data)
+        etag = res.headers.get("ETag")
+        last_modified = res.headers.get("Last-Modified")
+        expires_at = _expires_at(res.headers)
+        if etag or last_modified or expires_at:
+            self._cache_put(key, CachedResponse(data, etag, last_modified, expires_at))
+        return data
+
+    @staticmethod
+    def _read(res, deadline, chunk_size=16384):
+        """
+        Reads the body, giving up at deadline. requests' own timeout only limits each read, so a server trickling
+        the body out could otherwise hold the request (and the thread waiting on it) for ever.
+        """
+        # A body cut short raises instead of coming back truncated
+        res.raw.enforce_content_length = True
+
+        # The deadline is checked between chunks, and a read that's blocked when it passes is cut off by shutting
+        # the connection's socket down. Without a kept-alive connection to shut down, each read is still limited
+        # by the request's timeout.
+        sock = getattr(res.raw.connection, "sock", None)
+        timer = Timer(max(0, deadline - monotonic()), _shutdown, (sock,)) if sock is not None else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        chunks = []
+        try:
+            for chunk in res.iter_content(chunk_size):
+                chunks.append(chunk)
+                if monotonic() >= deadline and not res.raw.closed:
+                    raise TimeoutError(f"Reading {res.url} took too long")
+        except TimeoutError:
+            raise
+        except Exception:
+            if monotonic() >= deadline:
+                raise TimeoutError(f"Reading {res.url} took too long")
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+        return b"".join(chunks)
+
+    def _cache_get(self, key):
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is None:
+                return None
+            if cached.is_useless():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return cached
+
+    def _cache_put(self, key, cached):
+        with self._lock:
+            self._cache[key] = cached
+            self._cache.move_to_end(key)
+            for old_key in [k for k, v in self._cache.items() if v.is_useless()]:
+                del self._cache[old_key]
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+
+client = HttpClient()
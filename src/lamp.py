@@ -1,73 +1,37 @@
 import os
-import re
-
-import colr
-import inspect
-from time import sleep
-from requests import get
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
-try:
-    import board
-    import neopixel
-except ModuleNotFoundError:
-    pass
-
+from functools import partial
+from datetime import date, datetime, timedelta
+from src.history import history, Frame
+from src.render import render_text, render_html
+from src import frames
+from src import hardware
+from src import metrics
+from src.sources import DataSource
+from src.http_client import client
+from src.phases import get_phase_fraction, get_phase_number, get_calendar, NUM_PHASES, LUNAR_CYCLE
+from src.forecast import Forecast
+from src.schedule import Schedule
 load_dotenv(override=True)
 
 
-def gen_html(hex_color):
-    if hex_color == "#000000":
-        style = f"fill:#FFFFFF;stroke-width:1;stroke:#FFFFFF"
-    else:
-        style = f"fill:{hex_color};stroke-width:1;stroke:#000000"
-    out = f'<svg width="20" height="20"><rect width="20" height="20" style="{style}"/></svg>'
-    return out
-
-
 def hour_rounder(t):
     # Rounds to nearest hour by adding a timedelta hour if minute >= 30
     return t.replace(second=0, microsecond=0, minute=0, hour=t.hour) + timedelta(hours=t.minute//30)
 
 
-def contrast_color(color):
-    color = tuple(int(color.lstrip("#")[i:i+2], 16) for i in (0, 2, 4))
-    luminance = (0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]) / 255
-    return "#000000" if luminance > 0.5 else "#FFFFFF"
-
-
-def get_phase_fraction(current_datetime):
-    # https://minkukel.com/en/various/calculating-moon-phase/
-    lunar_cycle = 29.53058770576 * 24 * 3600  # Days to seconds
-    first_new = datetime(2000, 1, 6, 18, 14)
-
-    phase_fraction = ((current_datetime - first_new).total_seconds() % lunar_cycle) / lunar_cycle
-
-    return phase_fraction
-
-
-def get_phase_number(phase_fraction):
-    """
-    :param phase_fraction: The fraction of the moon that's illuminated (0 to 1)
-    :return: The phase number for the lamp (which can display 12 different phases) 0 to 11
-    """
-    assert 0 <= phase_fraction <=1, f"Invalid phase_fraction: {phase_fraction}"
-    phase_number = round(12*phase_fraction) % 12
-    return phase_number
-
-
 class Lamp:
+    # Name of the screen currently being shown, used as the div_id in the lamp history
+    _screen_id = None
+
     def __init__(self,
                  print_only=(os.getenv("PRINT_ONLY") == 'True'),
                  reverse_leds=(os.getenv("REVERSE_LEDS") == 'True'),
                  num_leds=int(os.getenv("NUM_LEDS"))):
-        if not print_only:
-            pixel_pin = board.D18
-            pixel_order = neopixel.GRB
-
-            self.pixels = neopixel.NeoPixel(pixel_pin, num_leds, brightness=1,
-                                            auto_write=False, pixel_order=pixel_order)
-            self.pixel_order = pixel_order
+        framebuffer = None if print_only else hardware.get_framebuffer(num_leds, reverse_leds)
+        if framebuffer is not None:
+            self.pixels = framebuffer.pixels
+            self.pixel_order = framebuffer.pixel_order
         else:
             self.pixels = None
             self.pixel_order = "RGB"
@@ -76,126 +40,151 @@ class Lamp:
         self.print_only = print_only
         self.num_leds = num_leds
 
-    def _show_leds(self, colors):
-        for i in range(len(colors)):
-            color = colors[i]
-            if self.pixel_order == "GRB":
-                color = (color[1], color[0], color[2])
-            led_idx = i if not self.reverse_leds else self.num_leds - i - 1
-            self.pixels[led_idx] = color
-        self.pixels.show()
+    def _show_leds(self, frame, blink=0):
+        hardware.get_compositor().show(frame, blink_times=blink)
 
     def catch_error(decorated):
         def wrapper(*args, **kwargs):
             func_name = decorated.__name__
             self = args[0]
+            self._screen_id = func_name
             try:
                 return decorated(*args, **kwargs)
             except Exception as e:
+                metrics.errors.inc(div_id=func_name)
                 self.show_error(f"Error on {func_name}: {str(e)}", div_id=func_name)
                 return True
 
         return wrapper
 
+    @staticmethod
+    def _as_of(source):
+        """
+        :return: Note of when the data was fetched if it's stale (refreshing it keeps failing), otherwise ""
+        """
+        if not source.is_stale():
+            return ""
+        fetched_at = datetime.now() - source.age()
+        return f" (as of {fetched_at:%a %H:%M})"
+
     def show_error(self, msg, div_id):
-        colors = 2 * [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
-        self.set_leds(colors, extra_info=msg, div_id=div_id)
+        frame = frames.pattern(self.num_leds, [(255, 0, 0), (0, 255, 0), (0, 0, 255)])
+        self.set_leds(frame, extra_info=msg, div_id=div_id)
 
     def leds_off(self):
-        self.set_leds(self.num_leds*[(0, 0, 0)], extra_info="Off")
+        self.set_leds(frames.solid(self.num_leds, frames.BLACK), extra_info="Off", div_id="leds_off")
 
-    def set_leds(self, colors, extra_info=None, blink=0, div_id=None):
+    def set_leds(self, colors, extra_info=None, blink=0, div_id=None, timestamp=None):
+        """
+        :param colors: A frame (flat RGB bytes, see src.frames) or a list of (r, g, b) tuples
+        :param timestamp: When the frame is from (default=now), e.g. when replaying a recording
+        """
         if div_id is None:
-            div_id = inspect.stack()[1][3]
-        assert self.num_leds == len(colors), f"Expecting {self.num_leds} colors not {len(colors)}"
-
-        hex_colors = ['#%02x%02x%02x' % c for c in colors]
-        current_time = str(datetime.now().replace(microsecond=0))
-
-        print_string = [current_time]
-        print_string.extend([colr.color(c, fore=contrast_color(c), back=c) for c in hex_colors])
-
-        print_string_html = [f'<div id="{div_id}"><font style="font-family:monospace;">{current_time}']
-        print_string_html.append(''.join([gen_html(c) for c in hex_colors]))
-
-        if extra_info:
-            print_string += [extra_info]
-            print_string_html += [extra_info]
-        print_string = "\t".join(print_string)
-
-        print_string_html[len(print_string_html)-1] += "</font></div>"
-        print_string_html = "\t".join(print_string_html)
-        
-        with open("./lamp.txt", "w") as f:
-            f.write(print_string)
-            f.write("\n")
-
-        html_file = []
-        replaced = False
-        if div_id != "leds_off":
-            # This will clear the file
-            with open("./lamp_html.txt", "r") as f:
-                for line in f:
-                    line_dt = re.search(r'\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}', line).group(0)
-                    line_dt = datetime.fromisoformat(line_dt)
-
-                    if re.search(div_id, line):
-                        html_file.append(print_string_html)
-                        replaced = True
-                    elif (datetime.now() - line_dt).seconds / 60 > 15:
-                        # Delete the line if it's more than 30 mins old
-                        pass
-                    else:
-                        html_file.append(line.strip())
-        if not replaced:
-            html_file.append(print_string_html)
-        html_file = "\n".join(html_file)
-        with open("./lamp_html.txt", "w") as f:
-            f.write(html_file)
-            f.write("\n")
+            div_id = self._screen_id
+        frame = bytes(colors) if isinstance(colors, (bytes, bytearray)) else frames.from_colors(colors)
+        assert 3 * self.num_leds == len(frame), f"Expecting {self.num_leds} colors not {len(frame) // 3}"
+
+        current_dt = (timestamp or datetime.now()).replace(microsecond=0)
+        current_time = str(current_dt)
+
+        with metrics.render_seconds.time():
+            print_string = render_text(current_time, frame, extra_info)
+            print_string_html = render_html(current_time, frame, extra_info, div_id)
+
+        history.add(Frame(div_id, current_dt, frame, extra_info, print_string, print_string_html))
 
         if self.print_only:
             print(print_string)
         else:
-            for _ in range(blink):
-                self._show_leds(colors)
-                sleep(0.25)
-                self._show_leds(self.num_leds*[(0,0,0)])
-                sleep(0.25)
-            self._show_leds(colors)
+            self._show_leds(frame, blink=blink)
+
+
+class LazyLamp:
+    """
+    Stands in for a lamp and only builds it the first time it's used,
+    so only the lamps for the selected screens are ever created
+    """
+    def __init__(self, lamp_class, *args, **kwargs):
+        self.lamp_class = lamp_class
+        self._args = args
+        self._kwargs = kwargs
+        self._lamp = None
+
+    @property
+    def lamp(self):
+        if self._lamp is None:
+            self._lamp = self.lamp_class(*self._args, **self._kwargs)
+        return self._lamp
+
+    def __getattr__(self, name):
+        return getattr(self.lamp, name)
 
 
 class MoonLamp(Lamp):
     on_hour = 8
     off_hour = 20
-    phase_numbers = {
-            -1: ['on', 'off', 'on', 'off', 'on', 'off'],
-            0: ['off', 'off', 'off', 'off', 'off', 'off'],
-            1: ['off', 'off', 'off', 'off', 'off', 'on'],
-            2: ['off', 'off', 'off', 'off', 'on', 'on'],
-            3: ['off', 'off', 'off', 'on', 'on', 'on'],
-            4: ['off', 'off', 'on', 'on', 'on', 'on'],
-            5: ['off', 'on', 'on', 'on', 'on', 'on'],
-            6: ['on', 'on', 'on', 'on', 'on', 'on'],
-            7: ['on', 'on', 'on', 'on', 'on', 'off'],
-            8: ['on', 'on', 'on', 'on', 'off', 'off'],
-            9: ['on', 'on', 'on', 'off', 'off', 'off'],
-            10: ['on', 'on', 'off', 'off', 'off', 'off'],
-            11: ['on', 'off', 'off', 'off', 'off', 'off']
-        }
-
-    def _get_light_status(self, phase_number):
-        assert phase_number in self.phase_numbers, "Invalid phase_number"
-        return self.phase_numbers[phase_number]
+    lit_color = (255, 255, 255)
+    dark_color = (0, 0, 50)
+
+    # Steps through the lunar cycle that the moon is drawn at
+    phase_bins = 1024
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Every frame the moon can show, so showing it is just a lookup
+        self._moon_table = frames.moon_table(self.num_leds, self.lit_color, self.dark_color, self.phase_bins)
+        self._phase_frames = [frames.moon(self.num_leds, phase_number / NUM_PHASES, self.lit_color, self.dark_color)
+                              for phase_number in range(NUM_PHASES)]
+        self._phase_frames.append(frames.pattern(self.num_leds, [self.lit_color, self.dark_color]))
+
+    def _get_moon_frame(self, phase_number):
+        assert -1 <= phase_number < NUM_PHASES, "Invalid phase_number"
+        # -1 (the error pattern) is the last one
+        return self._phase_frames[phase_number]
+
+    def _bin(self, phase_fraction):
+        return round(phase_fraction * self.phase_bins) % self.phase_bins
+
+    @staticmethod
+    def next_phase_change():
+        """
+        :return: When (UTC) the current moon phase will change
+        """
+        current_dt = datetime.utcnow()
+        return get_calendar(current_dt).next_change(current_dt)
+
+    def next_frame_change(self):
+        """
+        :return: When (UTC) the moon frame or phase will next change
+        """
+        current_dt = datetime.utcnow()
+        phase_fraction = get_phase_fraction(current_dt)
+        current = self._bin(phase_fraction)
+        frame = self._moon_table[current]
+        steps = 1
+        while steps < self.phase_bins and self._moon_table[(current + steps) % self.phase_bins] == frame:
+            steps += 1
+        # Bin i is shown from (i - 0.5) / phase_bins of the way through the cycle
+        fraction_left = ((current + steps - 0.5) / self.phase_bins - phase_fraction) % 1
+        frame_change = current_dt + timedelta(seconds=fraction_left * LUNAR_CYCLE)
+        return min(frame_change, self.next_phase_change())
 
     @Lamp.catch_error
-    def show_moon(self, phase_number=None):
-        if not phase_number:
-            phase_fraction = get_phase_fraction(datetime.utcnow())
+    def show_moon(self, phase_number=None, phase_fraction=None):
+        """
+        :param phase_number: Phase to show (0 to 11, or -1 for the error pattern) instead of the current one
+        :param phase_fraction: How far through the lunar cycle to show (0 to 1) instead of the current phase
+        """
+        if phase_fraction is not None:
             phase_number = get_phase_number(phase_fraction)
+            frame = self._moon_table[self._bin(phase_fraction)]
+        elif phase_number is None:
+            current_dt = datetime.utcnow()
+            phase_number = get_calendar(current_dt).phase_at(current_dt)
+            frame = self._moon_table[self._bin(get_phase_fraction(current_dt))]
+        else:
+            frame = self._get_moon_frame(phase_number)
 
-        light_status = self._get_light_status(phase_number)
-        colors = [(255, 255, 255) if s == "on" else (0, 0, 50) for s in light_status]
         phase_name = {
             0: "New",
             1: "Waxing crescent", 2: "Waxing crescent",
@@ -206,64 +195,45 @@ class MoonLamp(Lamp):
             9: "Last quarter",
             10: "Waning crescent", 11: "Waning crescent",
         }.get(phase_number)
-        self.set_leds(colors, extra_info=f"Current moon phase: {phase_name}")
+        self.set_leds(frame, extra_info=f"Current moon phase: {phase_name}")
         return True
 
 
 class WeatherLamp(Lamp):
     # TODO: find a way to flash between current and next hour/two hours/...
     api_key = os.getenv("WEATHER_API_KEY")
+    api_url = os.getenv("WEATHER_API_URL", "http://api.weatherapi.com/v1/forecast.json")
     lat = os.getenv("LAT")
     lon = os.getenv("LON")
     min_color = 0.1
 
-    _raw_weather = {}
-    _weather_updated_at = datetime(2020, 1, 1)
+    # How long the current conditions are used before falling back to the hourly forecast
+    current_ttl = timedelta(minutes=15)
 
-    def _update_weather(self):
-        url = f"http://api.weatherapi.com/v1/forecast.json?key={self.api_key}&q={self.lat},{self.lon}&days=2"
-        res = get(url)
-        res.raise_for_status()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._weather_source = DataSource("weather", self._fetch_weather,
+                                          ttl=timedelta(minutes=int(os.getenv("WEATHER_TTL_MINUTES", 60))))
 
-        weather = res.json()
+    def _fetch_weather(self, timeout=None):
+        url = f"{self.api_url}?key={self.api_key}&q={self.lat},{self.lon}&days=2"
+        return client.get_json(url, timeout=timeout, parse=Forecast.from_json)
 
+    def _get_weather(self, metric):
+        forecast = self._weather_source.get()
         current_dt = datetime.now()
         nearest_hour = hour_rounder(current_dt)
-        next_hour = nearest_hour + timedelta(hours=1)
-
-        nearest_date_index = 0 if nearest_hour.day == current_dt.day else 1
-        next_date_index = 0 if next_hour.day == current_dt.day else 1
-
-        forecast1 = weather["forecast"]["forecastday"][nearest_date_index]["hour"][nearest_hour.hour]
-        forecast2 = weather["forecast"]["forecastday"][next_date_index]["hour"][next_hour.hour]
-
-        chance_of_rain = max(int(forecast1["chance_of_rain"]), int(forecast2["chance_of_rain"]))
-        chance_of_snow = max(int(forecast1["chance_of_snow"]), int(forecast2["chance_of_snow"]))
-        precip_mm = max(forecast1["precip_mm"], forecast2["precip_mm"])
-
-        self._weather = {
-            "clouds": weather["current"]["cloud"],
-            "feels_like": weather["current"]["feelslike_f"],
-            "chance_of_rain": chance_of_rain,
-            "chance_of_snow": chance_of_snow,
-            "precip_mm": precip_mm,
-
-        }
-        self._raw_weather = weather
-        self._weather_updated_at = datetime.utcnow()
-
-    def _get_weather(self, metric):
-        if datetime.utcnow() - self._weather_updated_at > timedelta(minutes=15):
-            self._update_weather()
+        use_current = self._weather_source.age() <= self.current_ttl
 
         if metric == "cloudiness":
-            return self._weather["clouds"]
+            return forecast.current["cloud"] if use_current else forecast.at("cloud", nearest_hour)
         if metric == "feels_like":
-            return self._weather["feels_like"]
+            return forecast.current["feels_like"] if use_current else forecast.at("feels_like", nearest_hour)
         if metric == "precip":
-            chance_of_rain = self._weather["chance_of_rain"]
-            chance_of_snow = self._weather["chance_of_snow"]
-            precip_amount = self._weather["precip_mm"]
+            # Max over the nearest and next hour
+            chance_of_rain = forecast.window_max("chance_of_rain", nearest_hour, 2)
+            chance_of_snow = forecast.window_max("chance_of_snow", nearest_hour, 2)
+            precip_amount = forecast.window_max("precip_mm", nearest_hour, 2)
             if chance_of_rain == 0 and chance_of_snow == 0:
                 precip_type = None
                 precip_percent = 0
@@ -284,28 +254,21 @@ class WeatherLamp(Lamp):
     @Lamp.catch_error
     def show_sunniness(self, cloudiness=None):
         base_color = (255, 255, 0)
+        as_of = ""
         if cloudiness is None:
             cloudiness = self._get_weather("cloudiness")
-        sunniness = (100 - cloudiness) / (100 / self.num_leds)
-
-        full_leds = int(sunniness)
-        partial_led = sunniness - full_leds
-        if full_leds == 0 and partial_led < self.min_color:
-            partial_led = self.min_color
-
-        colors = full_leds*[base_color]
-        if partial_led > 0:
-            colors += [tuple(int(partial_led * v) for v in base_color)]
-        if len(colors) < self.num_leds:
-            for i in range(self.num_leds - len(colors)):
-                colors += [(0, 0, 0)]
-        self.set_leds(colors, extra_info=f"{cloudiness}% cloudy")
+            as_of = self._as_of(self._weather_source)
+        frame = frames.bar(self.num_leds, 100 - cloudiness, base_color, maximum=100,
+                           min_partial=self.min_color)
+        self.set_leds(frame, extra_info=f"{cloudiness}% cloudy{as_of}")
         return True
 
     @Lamp.catch_error
     def show_feels_like(self, feels_like=None):
+        as_of = ""
         if feels_like is None:
             feels_like = self._get_weather("feels_like")
+            as_of = self._as_of(self._weather_source)
 
         if feels_like < 20:
             base_color = (0, 191, 255)
@@ -324,18 +287,21 @@ class WeatherLamp(Lamp):
             temp_range = (110, 130)
 
         if temp_range[0] <= feels_like < temp_range[1]:
-            num_full_leds = int((feels_like - temp_range[0]) / 5) + 1
-            colors = num_full_leds*[base_color] + (self.num_leds - num_full_leds)*[(0, 0, 0)]
+            # Every 30 degree range spans the whole strip
+            num_full_leds = int((feels_like - temp_range[0]) / (30 / self.num_leds)) + 1
+            frame = frames.fill(self.num_leds, num_full_leds, base_color)
         else:
-            colors = 2*[base_color, (0, 0, 0), base_color]
+            frame = frames.pattern(self.num_leds, [base_color, frames.BLACK, base_color])
 
-        self.set_leds(colors, extra_info=f"It currently feels like {feels_like}F")
+        self.set_leds(frame, extra_info=f"It currently feels like {feels_like}F{as_of}")
         return True
 
     @Lamp.catch_error
     def show_precipitation(self, precip_percent=None, precip_type=None, precip_amount=None):
+        as_of = ""
         if precip_percent is None and precip_type is None and precip_amount is None:
             precip_forecast = self._get_weather("precip")
+            as_of = self._as_of(self._weather_source)
             precip_percent = precip_forecast["precip_percent"]
             precip_type = precip_forecast["precip_type"]
             precip_amount = precip_forecast["precip_amount"]
@@ -358,13 +324,9 @@ class WeatherLamp(Lamp):
 
         full_leds = round(precip_percent / (100 / self.num_leds))
 
-        colors = full_leds*[base_color]
-        if len(colors) < self.num_leds:
-            for i in range(self.num_leds - len(colors)):
-                colors += [(0, 0, 0)]
         if full_leds > 0:
-            text = f"There's a {precip_percent}% chance of {intensity}{precip_type} in the next two hours"
-            self.set_leds(colors, extra_info=text, blink=blink)
+            text = f"There's a {precip_percent}% chance of {intensity}{precip_type} in the next two hours{as_of}"
+            self.set_leds(frames.fill(self.num_leds, full_leds, base_color), extra_info=text, blink=blink)
             return True
         else:
             return False
@@ -374,51 +336,50 @@ class SportsLamp(Lamp):
     api_key = os.getenv("SPORTS_RADAR_KEY")
 
     _venue = "Wrigley Field"
-    _game = None
-    _schedule_updated_at = datetime(2020, 1, 1)
     _blue = (14, 51, 134)
     _red = (204, 52, 51)
 
-    def _update_schedule(self):
-        url = "http://statsapi.mlb.com/api/v1/schedule/games/?sportId=1"
-        res = get(url)
-        res.raise_for_status()
+    # Shared by every SportsLamp so tracking more venues doesn't mean more requests
+    _schedule_source = None
 
-        schedule = res.json()["dates"]
-        if len(schedule) == 0:
-            game_status = 'no_game'
-        else:
-            schedule = schedule[0]
-            games = {x['venue']['name']: x['dayNight'] for x in schedule["games"]}
-            game = games.get(self._venue)
-            game_status = game[0].upper() if game is not None else 'no_game'
+    def __init__(self, *args, venue=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if venue is not None:
+            self._venue = venue
+        if SportsLamp._schedule_source is None:
+            SportsLamp._schedule_source = DataSource("schedule", partial(Schedule.fetch, client),
+                                                     ttl=timedelta(hours=6))
 
-        self._game = game_status
+    def _get_schedule(self):
+        schedule = self._schedule_source.get()
+        if not schedule.covers(date.today()):
+            # Only waits for as long as the source's budget, an out of date schedule is no use
+            schedule = self._schedule_source.refresh_and_wait()
+        return schedule
 
     def _get_game(self):
-        if datetime.utcnow() - self._schedule_updated_at > timedelta(hours=6):
-            self._update_schedule()
-        return self._game
+        return self._get_schedule().game_at_venue(self._venue, date.today())
 
     @Lamp.catch_error
     def show_game(self, game=None):
         game_status = self._get_game() if game is None else game
+        as_of = self._as_of(self._schedule_source) if game is None else ""
         assert game_status in ("D", "N", "no_game"), "Invalid game status"
 
         if game_status == "D":
-            colors = 3*[self._red] + 3*[self._blue]
+            frame = frames.stretch(self.num_leds, [self._red, self._blue])
             text = "There's a Cubs game today"
         elif game_status == "N":
-            colors = 3*[self._blue] + 3*[self._red]
+            frame = frames.stretch(self.num_leds, [self._blue, self._red])
             text = "There's a Cubs game tonight"
         elif game_status == "no_game":
-            colors = 6 * [(0, 0, 0)]
+            frame = frames.solid(self.num_leds, frames.BLACK)
             text = "There's no Cubs game today"
         else:
-            colors = 3*[self._red, self._blue]
+            frame = frames.pattern(self.num_leds, [self._red, self._blue])
 
         if game_status != 'no_game':
-            self.set_leds(colors, extra_info=text)
+            self.set_leds(frame, extra_info=text + as_of)
             return True
         else:
             return False
@@ -427,7 +388,10 @@ class SportsLamp(Lamp):
 class ColorsLamp(Lamp):
 
     def show_colors(self, colors):
-        self.set_leds(colors, extra_info="Support Ukraine!")
+        """
+        :param colors: Colors spread evenly along the strip (e.g. the stripes of a flag)
+        """
+        self.set_leds(frames.stretch(self.num_leds, colors), extra_info="Support Ukraine!", div_id="show_colors")
         return True
 
 
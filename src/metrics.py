@@ -0,0 +1,176 @@
+"""
+Counters and histograms for the lamp daemon, exported in the Prometheus text format.
+Recording a value is a dict lookup and a few additions under a lock, so they're always on.
+"""
+from bisect import bisect_left
+from threading import Lock
+from time import perf_counter
+from contextlib import contextmanager
+
+# Seconds, from a fast frame render up to a slow API call
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labels)
+
+    def samples(self):
+        """
+        :return: List of (suffix, label values, extra label, value)
+        """
+        raise NotImplementedError
+
+    def export(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, values, extra)} {value!r}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labels=()):
+        super().__init__(name, help, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [("", key, "", value) for key, value in self._values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # Label values -> [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][idx] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total) in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    samples.append(("_bucket", key, f'le="{bound}"', cumulative))
+                samples.append(("_sum", key, "", total))
+                samples.append(("_count", key, "", cumulative))
+        return samples
+
+
+class Callback(Metric):
+    """
+    Metric read from somewhere else (e.g. a cache's own stats) when it's exported
+    """
+    def __init__(self, name, help, type, func, labels=()):
+        """
+        :param func: Returns a dict of label values (tuple) to value
+        """
+        super().__init__(name, help, labels)
+        self.type = type
+        self.func = func
+
+    def samples(self):
+        return [("", key, "", value) for key, value in self.func().items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, type, func, labels=()):
+        return self.register(Callback(name, help, type, func, labels))
+
+    def export(self):
+        return "\n".join(m.export() for m in self._metrics) + "\n"
+
+
+registry = Registry()
+
+fetch_seconds = registry.histogram("moonlamp_fetch_seconds", "Time taken to fetch each data source", ["source"])
+fetch_errors = registry.counter("moonlamp_fetch_errors_total", "Failed fetches of each data source", ["source"])
+screen_seconds = registry.histogram("moonlamp_screen_seconds",
+                                    "Time taken to show each screen, including waiting for its data", ["screen"])
+render_seconds = registry.histogram("moonlamp_render_seconds", "Time taken to render a frame to text and html")
+hardware_write_seconds = registry.histogram("moonlamp_hardware_write_seconds",
+                                            "Time taken to write a changed frame to the strip")
+slot_lateness_seconds = registry.histogram("moonlamp_slot_lateness_seconds",
+                                           "How late each screen was shown compared to when it was due")
+frame_lateness_seconds = registry.histogram("moonlamp_frame_lateness_seconds",
+                                            "How late each animation frame was shown compared to when it was due",
+                                            buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1))
+errors = registry.counter("moonlamp_errors_total", "Error frames shown instead of a screen", ["div_id"])
+http_requests = registry.counter("moonlamp_http_requests_total",
+                                 "API requests by host and how they were answered (cached, not_modified or fetched)",
+                                 ["host", "result"])
+
+
+def lru_cache_stats(**caches):
+    """
+    Exports the hits and misses of functools.lru_cache functions
+    :param caches: Cache name to cached function
+    """
+    def stats(field):
+        return lambda: {(name,): getattr(func.cache_info(), field) for name, func in caches.items()}
+
+    registry.callback("moonlamp_cache_hits_total", "Cache hits by cache", "counter", stats("hits"), ["cache"])
+    registry.callback("moonlamp_cache_misses_total", "Cache misses by cache", "counter", stats("misses"), ["cache"])
@@ -0,0 +1,110 @@
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+# https://minkukel.com/en/various/calculating-moon-phase/
+LUNAR_CYCLE = 29.53058770576 * 24 * 3600  # Days to seconds
+FIRST_NEW = datetime(2000, 1, 6, 18, 14)
+NUM_PHASES = 12
+
+
+def get_phase_fraction(current_datetime):
+    phase_fraction = ((current_datetime - FIRST_NEW).total_seconds() % LUNAR_CYCLE) / LUNAR_CYCLE
+
+    return phase_fraction
+
+
+def get_phase_number(phase_fraction):
+    """
+    :param phase_fraction: The fraction of the moon that's illuminated (0 to 1)
+    :return: The phase number for the lamp (which can display 12 different phases) 0 to 11
+    """
+    assert 0 <= phase_fraction <=1, f"Invalid phase_fraction: {phase_fraction}"
+    phase_number = round(NUM_PHASES*phase_fraction) % NUM_PHASES
+    return phase_number
+
+
+def get_phase_fractions(datetimes):
+    """
+    :param datetimes: Iterable of (UTC) datetimes
+    :return: array of phase fractions
+    """
+    return array('d', [((dt - FIRST_NEW).total_seconds() % LUNAR_CYCLE) / LUNAR_CYCLE for dt in datetimes])
+
+
+def get_phase_numbers(phase_fractions):
+    """
+    :param phase_fractions: Iterable of phase fractions
+    :return: array of phase numbers (0 to 11)
+    """
+    return array('b', [round(NUM_PHASES * f) % NUM_PHASES for f in phase_fractions])
+
+
+def get_next_phase_changes(datetimes):
+    """
+    The phase fraction grows linearly with time so the next change is where it crosses the next phase boundary
+    :param datetimes: Iterable of (UTC) datetimes
+    :return: List of datetimes at which the phase number next changes
+    """
+    out = []
+    for dt in datetimes:
+        cycles = (dt - FIRST_NEW).total_seconds() / LUNAR_CYCLE
+        # Phase k is shown from (k - 0.5)/12 to (k + 0.5)/12 of the way through a cycle
+        boundary_number = int(cycles * NUM_PHASES + 0.5)
+        next_change = FIRST_NEW + timedelta(seconds=(boundary_number + 0.5) / NUM_PHASES * LUNAR_CYCLE)
+        if next_change <= dt:
+            # dt is on a boundary (up to float precision), so it's the one after
+            next_change = FIRST_NEW + timedelta(seconds=(boundary_number + 1.5) / NUM_PHASES * LUNAR_CYCLE)
+        out.append(next_change)
+    return out
+
+
+class PhaseCalendar:
+    """
+    Exact phase transition times for a date range (a year by default) so the current phase
+    and the next change are a binary search away.
+    """
+    def __init__(self, start=None, end=None):
+        start = start or datetime.utcnow() - timedelta(days=LUNAR_CYCLE / 86400)
+        end = end or start + timedelta(days=366)
+        self.start = start
+        self.end = end
+
+        self.transitions = [start]
+        while self.transitions[-1] < end:
+            self.transitions += get_next_phase_changes([self.transitions[-1]])
+        # The phase in effect from each transition until the next one
+        midpoints = [a + (b - a) / 2 for a, b in zip(self.transitions, self.transitions[1:])]
+        self.phase_numbers = get_phase_numbers(get_phase_fractions(midpoints))
+
+    def _index(self, current_dt):
+        assert self.start <= current_dt < self.transitions[-1], f"{current_dt} is outside of the calendar"
+        return bisect_right(self.transitions, current_dt) - 1
+
+    def phase_at(self, current_dt):
+        return self.phase_numbers[self._index(current_dt)]
+
+    def next_change(self, current_dt):
+        return self.transitions[self._index(current_dt) + 1]
+
+    def schedule(self, start, end):
+        """
+        :return: List of (datetime the phase starts, phase number) covering start to end
+        """
+        first = self._index(start)
+        last = self._index(end)
+        return [(max(self.transitions[i], start), self.phase_numbers[i]) for i in range(first, last + 1)]
+
+
+_calendar = None
+
+
+def get_calendar(current_dt=None):
+    """
+    :return: A shared PhaseCalendar that covers current_dt (UTC)
+    """
+    global _calendar
+    current_dt = current_dt or datetime.utcnow()
+    if _calendar is None or not _calendar.start <= current_dt < _calendar.transitions[-1]:
+        _calendar = PhaseCalendar(start=current_dt)
+    return _calendar
@@ -1,10 +1,11 @@
 from src import lamp
 from src.screens import Screen
 
-weather_lamp = lamp.WeatherLamp()
-moon_lamp = lamp.MoonLamp()
-sports_lamp = lamp.SportsLamp()
-color_lamp = lamp.ColorsLamp()
+# Lamps are only built once one of their screens is shown
+weather_lamp = lamp.LazyLamp(lamp.WeatherLamp)
+moon_lamp = lamp.LazyLamp(lamp.MoonLamp)
+sports_lamp = lamp.LazyLamp(lamp.SportsLamp)
+color_lamp = lamp.LazyLamp(lamp.ColorsLamp)
 
 # Weather lamp screens
 feels_like_screen = Screen(weather_lamp, "show_feels_like")
@@ -13,12 +14,13 @@ daily_precip_screen = Screen(weather_lamp, "show_precipitation")
 
 # Moon lamp screens
 current_moon_screen = Screen(moon_lamp, "show_moon")
+current_moon_screen.changes_at = lambda: moon_lamp.next_frame_change()
 
 # Sports lamp screens
 game_today = Screen(sports_lamp, "show_game")
 
 # Flags
-ukraine_flag = Screen(color_lamp, "show_colors", colors=3*[(0, 87, 183)] + 3*[(255, 215, 0)])
+ukraine_flag = Screen(color_lamp, "show_colors", colors=[(0, 87, 183), (255, 215, 0)])
 
 # Error screen
 # TODO: Do this in a better way
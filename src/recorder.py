@@ -0,0 +1,209 @@
+"""
+Compact, append-only binary log of every frame the lamp shows, for long term history and for replaying.
+
+The file starts with MAGIC and a version, followed by records of a type byte and a payload length:
+    F  timestamp, frame (flat RGB bytes), div_id and extra_info
+    I  index block written every index_every frames: the offset of the previous index block, the number,
+       first timestamp and offset of the frames since then, and a footer (the block's own offset and
+       INDEX_MAGIC) so the last index block can be found from the end of the file.
+"""
+import os
+import struct
+from time import time
+from bisect import bisect_right
+from threading import Lock
+
+MAGIC = b"MLRC"
+INDEX_MAGIC = b"MLIX"
+VERSION = 1
+
+FILE_HEADER = struct.Struct("<4sH")
+RECORD_HEADER = struct.Struct("<cI")
+FRAME = struct.Struct("<dH")
+INDEX = struct.Struct("<QIdQ")
+INDEX_FOOTER = struct.Struct("<Q4s")
+
+
+class FrameRecorder:
+    """
+    Appends frames to a log. Meant to be added as a history listener, so every frame shown is recorded.
+    """
+    def __init__(self, path, index_every=256):
+        self.path = path
+        self.index_every = index_every
+
+        self._lock = Lock()
+        self._count = 0
+        self._first = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            log = FrameLog(path)
+            self._last_index = log.last_index
+            self._file = open(path, "r+b")
+            # Drop a record cut short by a crash, then carry on after the last complete one
+            self._file.truncate(log.end_offset())
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._last_index = 0
+            self._file = open(path, "wb")
+            self._file.write(FILE_HEADER.pack(MAGIC, VERSION))
+
+    def _append(self, record_type, payload):
+        offset = self._file.tell()
+        self._file.write(RECORD_HEADER.pack(record_type, len(payload)) + payload)
+        return offset
+
+    def record(self, frame, div_id=None, extra_info=None, timestamp=None):
+        """
+        :param frame: Flat RGB bytes
+        """
+        timestamp = time() if timestamp is None else timestamp
+        div_id = (div_id or "").encode()[:255]
+        info = (extra_info or "").encode()[:65535]
+        payload = (FRAME.pack(timestamp, len(frame)) + bytes(frame)
+                   + bytes([len(div_id)]) + div_id + struct.pack("<H", len(info)) + info)
+        with self._lock:
+            offset = self._append(b"F", payload)
+            if self._first is None:
+                self._first = (timestamp, offset)
+            self._count += 1
+            if self._count >= self.index_every:
+                self._write_index()
+            self._file.flush()
+
+    def __call__(self, frame):
+        """
+        History listener
+        """
+        self.record(frame.colors, frame.div_id, frame.extra_info)
+
+    def _write_index(self):
+        if not self._count:
+            return
+        block_start = self._file.tell()
+        payload = INDEX.pack(self._last_index, self._count, *self._first) + INDEX_FOOTER.pack(block_start,
+                                                                                          INDEX_MAGIC)
+        self._append(b"I", payload)
+        self._last_index = block_start
+        self._count = 0
+        self._first = None
+
+    def close(self):
+        with self._lock:
+            if self._file.closed:
+                return
+            self._write_index()
+            self._file.close()
+
+
+class FrameLog:
+    """
+    Reads a frame log. Opening it only reads the index blocks (the last one is found from the end of the file),
+    so seeking to a time is a binary search and a scan of at most one block of frames.
+    """
+    def __init__(self, path, tail_search=1 << 20):
+        """
+        :param tail_search: How far back from the end of the file to look for the last index block
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} isn't a frame log")
+            self.last_index = self._find_last_index(f, tail_search)
+            # First timestamp and offset of the frames covered by each index block, oldest first
+            self._timestamps, self._offsets = self._read_index(f)
+
+    @staticmethod
+    def _find_last_index(f, tail_search):
+        size = f.seek(0, os.SEEK_END)
+        tail_start = max(FILE_HEADER.size, size - tail_search)
+        f.seek(tail_start)
+        tail = f.read()
+        magic_at = len(tail)
+        while True:
+            magic_at = tail.rfind(INDEX_MAGIC, 0, magic_at)
+            footer_at = magic_at - (INDEX_FOOTER.size - len(INDEX_MAGIC))
+            if footer_at < 0:
+                return 0
+            block_start, _ = INDEX_FOOTER.unpack_from(tail, footer_at)
+            # The magic could also turn up inside a frame, so check it really ends the block it points at
+            if not FILE_HEADER.size <= block_start < tail_start + footer_at:
+                continue
+            f.seek(block_start)
+            header = f.read(RECORD_HEADER.size)
+            if len(header) == RECORD_HEADER.size:
+                record_type, length = RECORD_HEADER.unpack(header)
+                block_end = block_start + RECORD_HEADER.size + length
+                if record_type == b"I" and block_end == tail_start + magic_at + len(INDEX_MAGIC):
+                    return block_start
+
+    def _read_index(self, f):
+        timestamps = []
+        offsets = []
+        index_offset = self.last_index
+        while index_offset:
+            f.seek(index_offset + RECORD_HEADER.size)
+            index_offset, _, timestamp, offset = INDEX.unpack(f.read(INDEX.size))
+            timestamps.append(timestamp)
+            offsets.append(offset)
+        return timestamps[::-1], offsets[::-1]
+
+    def _records(self, f, offset):
+        """
+        Generator of (offset, record type, payload), stops at the end of the file or an incomplete record
+        """
+        f.seek(offset)
+        while True:
+            header = f.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            record_type, length = RECORD_HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield offset, record_type, payload
+            offset += RECORD_HEADER.size + length
+
+    def end_offset(self):
+        """
+        :return: The offset right after the last complete record
+        """
+        with open(self.path, "rb") as f:
+            if self.last_index:
+                f.seek(self.last_index)
+                _, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+                end = self.last_index + RECORD_HEADER.size + length
+            else:
+                end = FILE_HEADER.size
+            for offset, _, payload in self._records(f, end):
+                end = offset + RECORD_HEADER.size + len(payload)
+        return end
+
+    def frames(self, start=None, end=None):
+        """
+        Generator of (timestamp, div_id, frame, extra_info)
+        :param start: Unix time of the first frame (default=from the beginning)
+        :param end: Unix time to stop at (default=to the end)
+        """
+        offset = FILE_HEADER.size
+        if start is not None and self._timestamps:
+            offset = self._offsets[max(0, bisect_right(self._timestamps, start) - 1)]
+
+        with open(self.path, "rb") as f:
+            for _, record_type, payload in self._records(f, offset):
+                if record_type != b"F":
+                    continue
+                timestamp, frame_length = FRAME.unpack_from(payload)
+                if start is not None and timestamp < start:
+                    continue
+                if end is not None and timestamp > end:
+                    return
+
+                pos = FRAME.size
+                frame = payload[pos:pos + frame_length]
+                pos += frame_length
+                div_id = payload[pos + 1:pos + 1 + payload[pos]].decode()
+                pos += 1 + payload[pos]
+                info_length, = struct.unpack_from("<H", payload, pos)
+                extra_info = payload[pos + 2:pos + 2 + info_length].decode()
+                yield timestamp, div_id, frame, extra_info
@@ -0,0 +1,106 @@
+import zlib
+import struct
+from functools import lru_cache
+from src import metrics
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def gen_html(hex_color):
+    if hex_color == "#000000":
+        style = f"fill:#FFFFFF;stroke-width:1;stroke:#FFFFFF"
+    else:
+        style = f"fill:{hex_color};stroke-width:1;stroke:#000000"
+    out = f'<svg width="20" height="20"><rect width="20" height="20" style="{style}"/></svg>'
+    return out
+
+
+def hex_color(color):
+    return '#' + bytes(color).hex()
+
+
+def contrast_color(color):
+    luminance = (0.299 * color[0] + 0.587 * color[1] + 0.114 * color[2]) / 255
+    return "#000000" if luminance > 0.5 else "#FFFFFF"
+
+
+@lru_cache(maxsize=256)
+def terminal_cell(color):
+    import colr
+
+    hex_value = hex_color(color)
+    return colr.color(hex_value, fore=contrast_color(color), back=hex_value)
+
+
+@lru_cache(maxsize=256)
+def html_cell(color):
+    return gen_html(hex_color(color))
+
+
+@lru_cache(maxsize=128)
+def render_frame(frame, extra_info=None):
+    """
+    Renders everything in a frame that doesn't change between calls (i.e. everything but the time and div_id)
+    :param frame: Flat RGB bytes
+    :param extra_info: Text shown after the colors
+    :return: The terminal and html strings that follow the timestamp
+    """
+    colors = [frame[i:i + 3] for i in range(0, len(frame), 3)]
+    text = [terminal_cell(c) for c in colors]
+    html = [''.join([html_cell(c) for c in colors])]
+    if extra_info:
+        text.append(extra_info)
+        html.append(extra_info)
+    return "\t".join(text), "\t".join(html) + "</font></div>"
+
+
+def render_text(current_time, frame, extra_info=None):
+    return f"{current_time}\t{render_frame(frame, extra_info)[0]}"
+
+
+def render_html(current_time, frame, extra_info=None, div_id=None):
+    return (f'<div id="{div_id}"><font style="font-family:monospace;">{current_time}'
+            f'\t{render_frame(frame, extra_info)[1]}')
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def encode_png(width, height, pixels):
+    """
+    :param pixels: Flat RGB bytes, row by row
+    :return: The image as a PNG file (8 bit RGB)
+    """
+    stride = 3 * width
+    unchanged = b"\x02" + bytes(stride)
+    rows = []
+    previous = None
+    for y in range(height):
+        row = pixels[y * stride:(y + 1) * stride]
+        # Every row starts with its filter type: 2 (up) stores a row the same as the one above as zeros,
+        # which compress to almost nothing, otherwise 0 (none)
+        rows.append(unchanged if row == previous else b"\x00" + row)
+        previous = row
+    raw = b"".join(rows)
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (PNG_SIGNATURE + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", zlib.compress(raw))
+            + _png_chunk(b"IEND", b""))
+
+
+def render_png(frame, cell=20, gap=2, background=(32, 32, 32)):
+    """
+    Draws the strip as a row of squares, one per LED
+    :param frame: Flat RGB bytes
+    :param cell: Width and height of each LED in pixels
+    :param gap: Pixels between the LEDs and around the edge
+    """
+    num_leds = len(frame) // 3
+    width = num_leds * (cell + gap) + gap
+    gap_pixels = bytes(background) * gap
+    led_row = gap_pixels + b"".join(frame[i:i + 3] * cell + gap_pixels for i in range(0, len(frame), 3))
+    gap_row = bytes(background) * width
+    return encode_png(width, cell + 2 * gap, gap_row * gap + led_row * cell + gap_row * gap)
+
+
+metrics.lru_cache_stats(render_frame=render_frame, terminal_cell=terminal_cell, html_cell=html_cell)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Plays back a frame log recorded with RECORD_PATH, through the print-only or hardware path.
+
+    python -m src.replay lamp.rec --start "2023-05-16 08:00:00" --speed 60
+"""
+import click
+from time import monotonic, sleep
+from datetime import datetime
+from src.recorder import FrameLog
+
+
+@click.command()
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--start', type=click.DateTime(), help='Time (local) to start from (default=the beginning)')
+@click.option('--end', type=click.DateTime(), help='Time (local) to stop at (default=the end)')
+@click.option('--speed', default=1.0, help='How many times faster than real time to play, 0 for no waiting '
+                                           '(default=1)')
+@click.option('--hardware/--print-only', default=False, help='Show the frames on the strip (default=print only)')
+def replay(path, start, end, speed, hardware):
+    from src.lamp import Lamp
+    from src.history import history
+    from src import hardware as strip
+
+    # Leave the running lamp's lamp.txt/lamp_html.txt alone
+    history.text_path = history.html_path = None
+
+    log = FrameLog(path)
+    frames = log.frames(start=start and start.timestamp(), end=end and end.timestamp())
+    lamp = None
+    first = None
+    started_at = monotonic()
+    for timestamp, div_id, frame, extra_info in frames:
+        if lamp is None:
+            lamp = Lamp(print_only=not hardware, num_leds=len(frame) // 3)
+            first = timestamp
+        if speed > 0:
+            # Timed from the first frame, so the time taken to show each frame doesn't add up
+            delay = (timestamp - first) / speed - (monotonic() - started_at)
+            if delay > 0:
+                sleep(delay)
+        if len(frame) != 3 * lamp.num_leds:
+            print(f"Skipping frame from {datetime.fromtimestamp(timestamp)} with {len(frame) // 3} LEDs")
+            continue
+        lamp.set_leds(frame, extra_info=extra_info, div_id=div_id, timestamp=datetime.fromtimestamp(timestamp))
+
+    if hardware and strip.get_compositor() is not None:
+        # Let the last frames get to the strip before exiting
+        strip.get_compositor().close()
+
+
+if __name__ == "__main__":
+    replay()
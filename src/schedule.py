@@ -0,0 +1,55 @@
+import os
+from datetime import date, timedelta
+from collections import defaultdict
+
+SCHEDULE_URL = os.getenv("SCHEDULE_URL", "http://statsapi.mlb.com/api/v1/schedule/games/")
+
+
+class Schedule:
+    """
+    MLB games for a date range indexed by date, by (venue, date) and by (team, date),
+    so checking for a game never needs a network call.
+    """
+    def __init__(self, start_date, end_date, games):
+        self.start_date = start_date
+        self.end_date = end_date
+
+        self.by_date = defaultdict(list)
+        self.by_venue = {}
+        self.by_team = {}
+        for game_date, game in games:
+            self.by_date[game_date].append(game)
+            self.by_venue[(game["venue"]["name"], game_date)] = game
+            for side in ["home", "away"]:
+                self.by_team[(game["teams"][side]["team"]["name"], game_date)] = game
+
+    @classmethod
+    def fetch(cls, client, start_date=None, days=7, timeout=None):
+        start_date = start_date or date.today()
+        end_date = start_date + timedelta(days=days)
+
+        def parse(data):
+            games = [(date.fromisoformat(d["date"]), game) for d in data["dates"] for game in d["games"]]
+            return cls(start_date, end_date, games)
+
+        return client.get_json(SCHEDULE_URL, params={
+            "sportId": 1,
+            "startDate": start_date.isoformat(),
+            "endDate": end_date.isoformat(),
+        }, timeout=timeout, parse=parse)
+
+    def covers(self, game_date):
+        return self.start_date <= game_date <= self.end_date
+
+    def games_on(self, game_date):
+        return self.by_date.get(game_date, [])
+
+    def game_at_venue(self, venue, game_date):
+        """
+        :return: "D" for a day game, "N" for a night game or "no_game"
+        """
+        game = self.by_venue.get((venue, game_date))
+        return game["dayNight"][0].upper() if game is not None else "no_game"
+
+    def game_for_team(self, team, game_date):
+        return self.by_team.get((team, game_date))
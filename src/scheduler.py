@@ -0,0 +1,81 @@
+import heapq
+from itertools import count
+from time import monotonic, sleep
+from datetime import datetime
+
+# Longest wait for a wall clock time before checking the clock again, so the wait is corrected after the
+# clock is changed (DST, or NTP setting it after booting without an RTC)
+MAX_WALL_CLOCK_WAIT = 300
+
+
+class Scheduler:
+    """
+    Priority queue of timed events on the monotonic clock. run() sleeps exactly until the next event.
+    """
+    def __init__(self):
+        self._queue = []
+        self._counter = count()
+
+    def clear(self):
+        self._queue = []
+
+    def at(self, deadline, event, *args):
+        """
+        :param deadline: time.monotonic() value to run event at
+        :return: The deadline
+        """
+        heapq.heappush(self._queue, (deadline, next(self._counter), event, args))
+        return deadline
+
+    def after(self, seconds, event, *args):
+        return self.at(monotonic() + max(0, seconds), event, *args)
+
+    def at_datetime(self, dt, event, *args):
+        """
+        Runs event once datetime.now() reaches dt, checking the clock again at least every MAX_WALL_CLOCK_WAIT
+        seconds and when the wait is over
+        :param dt: Naive local datetime
+        """
+        seconds = min((dt - datetime.now()).total_seconds(), MAX_WALL_CLOCK_WAIT)
+        return self.after(seconds, self._at_datetime, dt, event, args)
+
+    def _at_datetime(self, dt, event, args):
+        if datetime.now() < dt:
+            self.at_datetime(dt, event, *args)
+        else:
+            event(*args)
+
+    def cancel(self, event):
+        self._queue = [e for e in self._queue
+                       if e[2] != event and not (e[2] == self._at_datetime and e[3][1] == event)]
+        heapq.heapify(self._queue)
+
+    def next_deadline(self):
+        return self._queue[0][0] if self._queue else None
+
+    def run(self, wakeup=None):
+        """
+        Waits for the next event and runs it
+        :param wakeup: Optional Event that interrupts the wait when set
+        :return: True if an event was run, False if woken up
+        """
+        while self._queue:
+            if wakeup is not None and wakeup.is_set():
+                # Also when running behind, so there's always a chance to be interrupted between events
+                return False
+            deadline, _, event, args = self._queue[0]
+            delay = deadline - monotonic()
+            if delay > 0:
+                if wakeup is None:
+                    sleep(delay)
+                elif wakeup.wait(delay):
+                    return False
+                continue
+            heapq.heappop(self._queue)
+            event(*args)
+            return True
+
+        # Nothing scheduled, wait to be told otherwise
+        if wakeup is not None:
+            wakeup.wait()
+        return False
@@ -1,135 +1,304 @@
-import os
-from time import sleep
-from requests import get
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, time
+from itertools import count
+from time import monotonic
+from threading import Condition, Event
+from datetime import date, datetime, timedelta, time
+from src.history import history, frame_as_dict
+from src.scheduler import Scheduler
+from src.astro import get_table
+from src import metrics
 
 load_dotenv(override=True)
 
+# Each mode is a generator of the (on_at, off_at) windows the lamp should be on for
+MODES = {}
 
-def get_switch_datetime(hour, tomorrow=False):
-    current_dt = datetime.now()
-    if tomorrow:
-        current_dt = current_dt + timedelta(hours=24)
-    out = datetime(current_dt.year, current_dt.month, day=current_dt.day, hour=hour)
-    return out
-
-
-def get_moon_times(current_dt=datetime.now()):
-    results = []
-    for delta in [-24, 0, 24, 48]:
-        date = current_dt + timedelta(hours=delta)
-        res = get("https://api.ipgeolocation.io/astronomy",
-                  params={"apiKey": os.getenv("API_KEY"), "date": date.strftime("%Y-%m-%d")})
-        res.raise_for_status()
-        data = res.json()
-
-        for s in ["rise", "set"]:
-            value = data.get(f"moon{s}")
-            value = time(int(value[:2]), int(value[3:])) if value != '-:-' else None
-            if value:
-                value = datetime(year=date.year, month=date.month, day=date.day, hour=value.hour, minute=value.minute)
-                results += [(s, value)]
-    results = sorted(results, key=lambda x: x[1])
-
-    for i in range(len(results)):
-        if results[i][1] < datetime.now() <= results[i + 1][1]:
-            if results[i][0] == "rise":
-                moon_up = True
-                moon_rise = results[i][1]
-                moon_set = results[i+1][1]
-            else:
-                # Return next moon rise/set
-                moon_up = False
-                moon_rise = results[i+1][1]
-                moon_set = results[i+2][1]
-            break
+
+def mode(name):
+    def register(windows):
+        MODES[name] = windows
+        return windows
+    return register
+
+
+def get_moon_times(current_dt=None):
+    """
+    :return: The current/next moon rise, the set after it and if the moon is currently up
+    """
+    current_dt = current_dt or datetime.now()
+    moon = get_table("moon")
+
+    if moon.is_up(current_dt):
+        moon_rise, _ = moon.previous_event(current_dt, "rise")
+        moon_set, _ = moon.next_event(current_dt, "set")
+        moon_up = True
+    else:
+        moon_rise, _ = moon.next_event(current_dt, "rise")
+        moon_set, _ = moon.next_event(moon_rise, "set")
+        moon_up = False
 
     return moon_rise, moon_set, moon_up
 
 
-def sleep_until(dt):
-    sleep_length = (dt - datetime.now()).total_seconds()
-    sleep_length = max(0, sleep_length)
-    print(f"Sleeping until {dt}")
-    sleep(sleep_length)
+@mode("on")
+def always_on(screens):
+    on_at = datetime.now()
+    yield on_at, on_at + timedelta(days=1000)
+
+
+@mode("off")
+def always_off(screens):
+    return
+    yield
+
+
+@mode("timer")
+def timer(screens):
+    on_at = datetime.now()
+    yield on_at, on_at + timedelta(minutes=screens.timer_length)
+
+
+@mode("day_only")
+def day_only(screens):
+    current_dt = datetime.now()
+    # Start tomorrow if today's window is over
+    first_day = 1 if current_dt.time() >= time(screens.off_hour) else 0
+    for days in count(first_day):
+        day = date.today() + timedelta(days=days)
+        yield datetime.combine(day, time(screens.on_hour)), datetime.combine(day, time(screens.off_hour))
+
+
+@mode("with_moon")
+def with_moon(screens):
+    current_dt = datetime.now()
+    while True:
+        moon_rise, moon_set, _ = get_moon_times(current_dt)
+        yield moon_rise, moon_set
+        current_dt = moon_set + timedelta(seconds=1)
+
+
+def _positive_int(name, value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid value for {name}: {value!r}")
+    if value < 1:
+        raise ValueError(f"Invalid value for {name}: {value}, it needs to be at least 1")
+    return value
 
 
 class Screen:
     def __init__(self, obj, method, *args, **kwargs):
-        self.method_to_call = getattr(obj, method)
-        self.off = getattr(obj, "leds_off")
+        self.name = method
+        self.obj = obj
+        self.method = method
         self.args = args
         self.kwargs = kwargs
+        # Optional function returning when (UTC) what the screen shows will next change
+        self.changes_at = None
+
+    def off(self):
+        return self.obj.leds_off()
 
     def show_screen(self):
-        return self.method_to_call(*self.args, **self.kwargs)
+        return getattr(self.obj, self.method)(*self.args, **self.kwargs)
 
 
 class Screens:
-    def __init__(self, screens, delay=5):
+    def __init__(self, screens, delay=5, get_screen=None):
         self.on_hour = 7 
         self.off_hour = 20
-        self.off = screens[0].off
         self.screens = screens
         self.delay = delay
+        # Looks up a screen by name when the screen list is changed while running
+        self.get_screen = get_screen
 
-    def show_screens(self, mode="on", timer_length=1):
-        lamp_on = True
-
-        if mode == "on":
-            on_at = datetime.now()
-            off_at = on_at + timedelta(days=1000)
-        elif mode == "off":
-            self.off()
-            return None
-        elif mode == "timer":
-            on_at = datetime.now()
-            off_at = on_at + timedelta(minutes=timer_length)
-        elif mode == "day_only":
-            current_dt = datetime.now()
-            if time(self.on_hour) <= current_dt.time() < time(self.off_hour):
-                on_at = get_switch_datetime(self.on_hour)  # 8am today
-                off_at = get_switch_datetime(self.off_hour)  # 8pm today
-            elif current_dt.time() < time(self.on_hour):
-                lamp_on = False
-                on_at = get_switch_datetime(self.on_hour)  # 8am today
-                off_at = get_switch_datetime(self.off_hour)  # 8pm today
-            elif time(self.off_hour) <= current_dt.time():
-                lamp_on = False
-                on_at = get_switch_datetime(self.on_hour, True)  # 8am tomorrow
-                off_at = get_switch_datetime(self.off_hour, True)  # 8pm tomorrow
-        elif mode == "with_moon":
-            on_at, off_at, lamp_on = get_moon_times()
-        else:
+        self.mode = None
+        self.timer_length = None
+        self.lamp_on = False
+        self.on_at = None
+        self.off_at = None
+        self.current_screen = None
+
+        self._scheduler = Scheduler()
+        self._windows = None
+        self._shown_in_cycle = 0
+        # (index, deadline) of the next screen to show
+        self._next_slot = None
+
+        self._pending = None
+        # Each change gets a number, _acked is the last one applied
+        self._requested = 0
+        self._applying = 0
+        self._acked = 0
+        self._wakeup = Event()
+        self._lock = Condition()
+
+    def off(self):
+        return self.screens[0].off()
+
+    def status(self):
+        return {
+            "mode": self.mode,
+            "delay": self.delay,
+            "timer_length": self.timer_length,
+            "lamp_on": self.lamp_on,
+            "on_at": self.on_at,
+            "off_at": self.off_at,
+            "current_screen": self.current_screen,
+            "last_frame": frame_as_dict(history.last_frame()),
+        }
+
+    def reconfigure(self, mode=None, delay=None, timer_length=None, screens=None, timeout=10):
+        """
+        Changes the settings of the running show_screens loop, interrupting whatever it's waiting on
+        :param screens: List of screen names (looked up with get_screen)
+        :return: True once the change was applied (for a new mode, once it was started), False if it wasn't
+                 applied within timeout (seconds)
+        """
+        if mode is not None and mode not in MODES:
             raise ValueError(f"Invalid value for mode: {mode}")
+        # Checked here rather than when applied, so a bad value goes back to the caller instead of
+        # stopping the display loop
+        if delay is not None:
+            delay = _positive_int("delay", delay)
+        if timer_length is not None:
+            timer_length = _positive_int("timer_length", timer_length)
+        if screens is not None:
+            if self.get_screen is None:
+                raise ValueError("Changing screens isn't supported")
+            if len(screens) == 0:
+                raise ValueError("At least one screen is needed")
+            screens = [self._lookup_screen(name) for name in screens]
+        changes = {"mode": mode, "delay": delay, "timer_length": timer_length, "screens": screens}
+        with self._lock:
+            # Changes that come in before the loop gets to them are applied together
+            self._pending = {**(self._pending or {}), **{k: v for k, v in changes.items() if v is not None}}
+            self._requested += 1
+            ticket = self._requested
+            self._wakeup.set()
+            return self._lock.wait_for(lambda: self._acked >= ticket, timeout)
 
-        print(f"Initial on at: {on_at}")
-        print(f"Initial off at: {off_at}")
+    def _lookup_screen(self, name):
+        try:
+            screen = self.get_screen(name)
+        except AttributeError:
+            screen = None
+        if not isinstance(screen, Screen):
+            raise ValueError(f"Unknown screen: {name}")
+        return screen
 
-        if not lamp_on:
-            self.off()
+    def _ack(self):
+        with self._lock:
+            self._acked = self._applying
+            self._lock.notify_all()
+
+    def _apply_pending(self):
+        with self._lock:
+            pending, self._pending = self._pending, None
+            self._applying = self._requested
+            self._wakeup.clear()
+        if pending is None:
+            return False
+        restart = (pending.get("mode", self.mode) != self.mode
+                   or pending.get("timer_length", self.timer_length) != self.timer_length)
+        self.mode = pending.get("mode", self.mode)
+        self.delay = pending.get("delay", self.delay)
+        self.timer_length = pending.get("timer_length", self.timer_length)
+        if "screens" in pending:
+            self.screens = pending["screens"]
+        if not restart and self.lamp_on and self._next_slot is not None:
+            # Carry on in the same window, only bringing the next screen forward if the new delay is shorter
+            idx, deadline = self._next_slot
+            self._scheduler.cancel(self._show_slot)
+            deadline = min(deadline, monotonic() + self.delay)
+            self._next_slot = (idx, deadline)
+            self._scheduler.at(deadline, self._show_slot, idx, deadline)
+        print(f"Changed {', '.join(pending)}")
+        if not restart:
+            self._ack()
+        return restart
+
+    def show_screens(self, mode="on", timer_length=1):
+        self.mode = mode
+        self.timer_length = timer_length
         while True:
-            current_dt = datetime.now()
-            if on_at <= current_dt < off_at:
-                lamp_on = True
-                for screen in self.screens:
-                    displayed = screen.show_screen()
-                    if displayed:
-                        sleep(self.delay)
-            else:
-                if mode == "timer":
-                    self.off()
-                    break
-                elif lamp_on and mode == "day_only":
-                    on_at = get_switch_datetime(self.on_hour, True)
-                    off_at = get_switch_datetime(self.off_hour, True)
-                    print(f"Next on at: {on_at}")
-                    print(f"Next off at: {off_at}")
-                elif lamp_on and mode == "with_moon":
-                    on_at, off_at, _ = get_moon_times()
-                    print(f"Next on at: {on_at}")
-                    print(f"Next off at: {off_at}")
-                self.off()
-                lamp_on = False
-                sleep_until(on_at)
+            self._start_mode()
+            self._ack()
+            # Woken up by a change, only start the mode over (and its on/off windows) if it changed
+            while not self._apply_pending():
+                while self._scheduler.run(self._wakeup):
+                    pass
+
+    def _start_mode(self):
+        if self.mode not in MODES:
+            raise ValueError(f"Invalid value for mode: {self.mode}")
+        self._scheduler.clear()
+        self._next_slot = None
+        self._windows = MODES[self.mode](self)
+        self._next_window()
+
+    def _next_window(self):
+        window = next(self._windows, None)
+        if window is None:
+            # The mode is over (e.g. the timer ran out)
+            self.on_at, self.off_at = None, None
+            self._turn_off()
+            if self.mode == "timer":
+                self.mode = "off"
+            return
+
+        self.on_at, self.off_at = window
+        print(f"Next on at: {self.on_at}")
+        print(f"Next off at: {self.off_at}")
+        if self.on_at <= datetime.now():
+            self._turn_on()
+        else:
+            self._turn_off()
+            self._scheduler.at_datetime(self.on_at, self._turn_on)
+        self._scheduler.at_datetime(self.off_at, self._window_over)
+
+    def _turn_on(self):
+        self.lamp_on = True
+        self._shown_in_cycle = 0
+        now = monotonic()
+        self._next_slot = (0, now)
+        self._scheduler.at(now, self._show_slot, 0, now)
+
+    def _turn_off(self):
+        self.lamp_on = False
+        self.current_screen = None
+        self.off()
+
+    def _window_over(self):
+        self._scheduler.cancel(self._show_slot)
+        self._next_slot = None
+        self._next_window()
+
+    def _show_slot(self, idx, deadline):
+        idx = idx % len(self.screens)
+        screen = self.screens[idx]
+        self.current_screen = screen.name
+        # Time the next slot from when this one was due, so running late doesn't add up.
+        # If it's more than a whole slot late, start counting from now instead.
+        metrics.slot_lateness_seconds.observe(max(0, monotonic() - deadline))
+        slot_start = deadline if monotonic() - deadline < self.delay else monotonic()
+        with metrics.screen_seconds.time(screen=screen.name):
+            displayed = screen.show_screen()
+
+        if idx == 0:
+            self._shown_in_cycle = 0
+        if displayed:
+            self._shown_in_cycle += 1
+
+        if len(self.screens) == 1 and displayed and screen.changes_at is not None:
+            # Nothing else to show, so only wake up when the screen will change
+            delay = (screen.changes_at() - datetime.utcnow()).total_seconds() + 1
+        elif displayed or (idx == len(self.screens) - 1 and self._shown_in_cycle == 0):
+            # Also wait if a whole cycle had nothing to show
+            delay = self.delay
+        else:
+            delay = 0
+        next_deadline = slot_start + max(0, delay)
+        self._next_slot = (idx + 1, next_deadline)
+        self._scheduler.at(next_deadline, self._show_slot, idx + 1, next_deadline)
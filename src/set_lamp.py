@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
+import os
+import sys
 import click
-from src.screens import Screens
+import atexit
+import signal
+from src.screens import Screens, _positive_int
+from src.control import ControlServer
+from src.history import history, frame_as_dict
+from src.metrics import registry
+from src.recorder import FrameRecorder
+from src.terminal import TerminalView
 import src.possible_screens as ps
 
 
@@ -12,9 +21,40 @@ import src.possible_screens as ps
 @click.option('-m', '--mode', default="day_only", help='Which mode to use (default=day_only)')
 @click.option('-t', '--timer-length', default=1,
               help='How long, in hours, to leave the lamp on in timer mode (default=1)')
-def set_lamp(screen, delay, mode, timer_length):
+@click.option('--view', is_flag=True, help='Show the strip in the terminal, redrawn in place, instead of printing '
+                                           'every frame')
+def set_lamp(screen, delay, mode, timer_length, view):
+    try:
+        delay = _positive_int("delay", delay)
+        timer_length = _positive_int("timer_length", timer_length)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    # set_lamp.sh stops the lamp with SIGTERM, exit cleanly so the lamp history gets flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     screens_to_show = [getattr(ps, s) for s in screen]
-    screens = Screens(screens=screens_to_show, delay=delay)
+    screens = Screens(screens=screens_to_show, delay=delay, get_screen=lambda name: getattr(ps, name))
+
+    if os.getenv("RECORD_PATH"):
+        # Keep every frame shown, see src/replay.py
+        recorder = FrameRecorder(os.getenv("RECORD_PATH"))
+        history.add_listener(recorder)
+        atexit.register(recorder.close)
+
+    if view:
+        terminal_view = TerminalView(status=screens.status)
+        history.add_listener(terminal_view)
+        atexit.register(terminal_view.close)
+        # Anything else printed would scroll the view away
+        sys.stdout = open(os.devnull, "w")
+
+    control_server = ControlServer()
+    control_server.register("status", screens.status)
+    control_server.register("set", screens.reconfigure)
+    control_server.register("frames", lambda: [frame_as_dict(f) for f in history.frames()])
+    control_server.register("metrics", registry.export)
+    control_server.register_stream("subscribe", history.subscribe)
+    control_server.start()
+
     screens.show_screens(mode=mode, timer_length=timer_length)
 
 
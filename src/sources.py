@@ -0,0 +1,144 @@
+import os
+import random
+from time import monotonic
+from threading import Lock
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from src import metrics
+
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("REFRESH_WORKERS", 2)), thread_name_prefix="refresh")
+
+# Longest a screen waits on a fetch before giving up on it for this slot
+BUDGET = float(os.getenv("FETCH_BUDGET_SECONDS", 5))
+
+# Every source by name, for the metrics
+_sources = {}
+
+
+class SourceUnavailable(Exception):
+    pass
+
+
+class DataSource:
+    """
+    Latest snapshot of some external data. Once the snapshot is older than ttl - refresh_ahead a refresh is
+    started on a worker thread and the current (possibly stale) snapshot keeps being served until it finishes.
+    Only the very first get() waits on the network, and never for longer than budget.
+
+    Failed refreshes are retried with exponential backoff (with jitter). After failure_threshold failures in a row
+    the circuit opens: nothing is fetched for open_seconds, then a single refresh is let through to try again.
+    """
+    def __init__(self, name, fetch, ttl, refresh_ahead=None, budget=BUDGET,
+                 base_backoff=5, max_backoff=300, failure_threshold=5, open_seconds=900):
+        """
+        :param fetch: Called with a timeout (budget), the longest the fetch may take in seconds
+        :param budget: Longest get() waits for a fetch, in seconds
+        :param base_backoff: Delay before retrying after the first failure, doubled with every failure after that
+        """
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.refresh_ahead = refresh_ahead if refresh_ahead is not None else ttl / 5
+        self.budget = budget
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self.updated_at = None
+        self.error = None
+        self.failures = 0
+        self._retry_at = None
+        self._value = None
+        self._future = None
+        self._lock = Lock()
+        _sources[name] = self
+
+    def _retry_delay(self):
+        if self.failures >= self.failure_threshold:
+            return self.open_seconds
+        delay = min(self.max_backoff, self.base_backoff * 2 ** (self.failures - 1))
+        # Half fixed, half random, so retries don't line up with each other (or with other lamps)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _refresh(self):
+        try:
+            with metrics.fetch_seconds.time(source=self.name):
+                # Fetches are cut off at the budget too, so a slow server can't tie up a refresh worker
+                value = self.fetch(timeout=self.budget)
+        except Exception as e:
+            with self._lock:
+                self.error = e
+                self.failures += 1
+                self._retry_at = monotonic() + self._retry_delay()
+            metrics.fetch_errors.inc(source=self.name)
+            print(f"Error refreshing {self.name}: {e}")
+            raise
+        with self._lock:
+            self._value = value
+            self.updated_at = datetime.utcnow()
+            self.error = None
+            self.failures = 0
+            self._retry_at = None
+        return value
+
+    def circuit_open(self):
+        return self.failures >= self.failure_threshold and self._backing_off()
+
+    def _backing_off(self):
+        return self._retry_at is not None and monotonic() < self._retry_at
+
+    def refresh(self):
+        """
+        Starts a refresh, unless one is already running or the last one failed too recently
+        :return: Future of the running refresh, or of the last one if it's too soon to try again
+        """
+        with self._lock:
+            if self._future is None or (self._future.done() and not self._backing_off()):
+                self._future = _executor.submit(self._refresh)
+            return self._future
+
+    def refresh_and_wait(self):
+        """
+        Refreshes and waits for the new snapshot, for at most budget
+        :return: The new snapshot
+        :raise SourceUnavailable: If the refresh failed, took too long or can't be tried yet
+        """
+        future = self.refresh()
+        try:
+            return future.result(timeout=self.budget)
+        except FutureTimeout:
+            # The refresh carries on in the background, a later get() will pick it up
+            raise SourceUnavailable(f"{self.name} took longer than {self.budget}s")
+        except Exception as e:
+            raise SourceUnavailable(f"{self.name} unavailable: {e}") from e
+
+    def age(self):
+        if self.updated_at is None:
+            return None
+        return datetime.utcnow() - self.updated_at
+
+    def is_stale(self):
+        return self.updated_at is None or self.age() > self.ttl
+
+    def get(self):
+        """
+        :return: The latest snapshot, which may be stale (see is_stale) if refreshing it keeps failing
+        :raise SourceUnavailable: If there's no snapshot yet and one couldn't be fetched within budget
+        """
+        if self.updated_at is None:
+            # Nothing to serve yet, so wait for the first fetch
+            return self.refresh_and_wait()
+        if self.age() > self.ttl - self.refresh_ahead:
+            self.refresh()
+        return self._value
+
+
+metrics.registry.callback("moonlamp_source_age_seconds", "Age of the snapshot served by each data source", "gauge",
+                          lambda: {(name,): source.age().total_seconds()
+                                   for name, source in _sources.items() if source.updated_at is not None},
+                          ["source"])
+metrics.registry.callback("moonlamp_source_circuit_open", "Whether fetching each data source is paused after "
+                          "repeated failures", "gauge",
+                          lambda: {(name,): int(source.circuit_open()) for name, source in _sources.items()},
+                          ["source"])
@@ -0,0 +1,137 @@
+import sys
+import shutil
+from time import monotonic, sleep
+from threading import Thread, Event, Lock
+
+# Each LED is drawn as this many spaces with the LED's color as the background
+CELL_WIDTH = 2
+
+ENTER = "\x1b[?1049h\x1b[?25l"  # Alternate screen, hide the cursor
+EXIT = "\x1b[0m\x1b[?25h\x1b[?1049l"
+CLEAR = "\x1b[0m\x1b[2J"
+RESET = "\x1b[0m"
+
+
+def _move(row, col):
+    return f"\x1b[{row};{col}H"
+
+
+class TerminalView:
+    """
+    Live view of the strip in the terminal. The strip is drawn once and then only the LEDs that changed are
+    redrawn in place, at most max_fps times a second, with a status line (screen, mode, next on/off and the
+    frame's extra_info) under it. Meant to be added as a history listener.
+    """
+    def __init__(self, status=None, out=None, max_fps=30):
+        """
+        :param status: Returns a dict with the mode, lamp_on, on_at and off_at (e.g. Screens.status)
+        :param out: Where to draw (default=sys.stdout as it is now)
+        """
+        self.status = status
+        self.out = out or sys.stdout
+        self.max_fps = max_fps
+
+        self._frame = None
+        self._shown = None
+        self._status_line = None
+        self._size = None
+        self._drawn_at = 0
+        self._changed = Event()
+        self._closed = False
+        self._lock = Lock()
+        self._thread = None
+
+    def __call__(self, frame):
+        """
+        History listener, only keeps the newest frame so a burst of frames is drawn once
+        """
+        self._frame = frame
+        self._changed.set()
+        if self._thread is None:
+            self._thread = Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        self.out.write(ENTER)
+        while not self._closed:
+            # Also wakes up every second to keep the status line up to date
+            self._changed.wait(timeout=1)
+            wait = self._drawn_at + 1 / self.max_fps - monotonic()
+            if wait > 0:
+                # Only the newest of the frames that come in meanwhile gets drawn
+                sleep(wait)
+            self._changed.clear()
+            self.draw()
+
+    def _next_transition(self, status):
+        if status.get("lamp_on") and status.get("off_at"):
+            return f"off at {status['off_at']:%b %d %H:%M}"
+        if not status.get("lamp_on") and status.get("on_at"):
+            return f"on at {status['on_at']:%b %d %H:%M}"
+        return ""
+
+    def _status(self, frame):
+        parts = [f"{frame.timestamp:%H:%M:%S}", frame.div_id or ""]
+        if self.status is not None:
+            status = self.status()
+            parts += [status.get("mode") or "", self._next_transition(status)]
+        parts.append(frame.extra_info or "")
+        return " | ".join(p for p in parts if p)
+
+    def draw(self):
+        with self._lock:
+            frame = self._frame
+            if frame is None or self._closed:
+                return
+            colors = frame.colors
+            size = shutil.get_terminal_size()
+            leds_per_row = max(1, size.columns // CELL_WIDTH)
+
+            out = []
+            if size != self._size or self._shown is None or len(self._shown) != len(colors):
+                # Start over when the terminal or the strip changes size
+                out.append(CLEAR)
+                self._size = size
+                self._shown = None
+                self._status_line = None
+
+            if colors != self._shown:
+                cursor = None
+                last_color = None
+                for i in range(0, len(colors), 3):
+                    color = colors[i:i + 3]
+                    if self._shown is not None and self._shown[i:i + 3] == color:
+                        continue
+                    led = i // 3
+                    row, col = 1 + led // leds_per_row, 1 + CELL_WIDTH * (led % leds_per_row)
+                    # Runs of changed LEDs only need one cursor move, and runs of the same color one color change
+                    if cursor != (row, col):
+                        out.append(_move(row, col))
+                    if color != last_color:
+                        out.append(f"\x1b[48;2;{color[0]};{color[1]};{color[2]}m")
+                        last_color = color
+                    out.append(" " * CELL_WIDTH)
+                    cursor = (row, col + CELL_WIDTH)
+                out.append(RESET)
+                self._shown = colors
+
+            status_line = self._status(frame)[:size.columns]
+            if status_line != self._status_line:
+                rows = -(-(len(colors) // 3) // leds_per_row)
+                out.append(_move(rows + 2, 1) + "\x1b[2K" + status_line)
+                self._status_line = status_line
+
+            if out:
+                self.out.write("".join(out))
+                self.out.flush()
+            self._drawn_at = monotonic()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            if self._thread is not None:
+                self.out.write(EXIT)
+                self.out.flush()
+        self._changed.set()